@@ -0,0 +1,201 @@
+"""
+Transcription engines. A backend loads a model by name and returns an object
+with openai-whisper's interface: `transcribe(audio, **options)` returning a
+dict with "text", "language" and "segments" (dicts with id, start, end and
+text), and `is_multilingual`. The caches, the parallel and streaming
+transcribers and the subtitle writers only rely on that, so the engine can be
+chosen per deployment with TRANSCRIBE_BACKEND.
+"""
+import json
+import os
+import pathlib
+import pickle
+import time
+
+import numpy as np
+import torch
+import whisper
+
+# "whisper" (openai-whisper, the reference) or "faster-whisper" (CTranslate2, CPU optimized).
+TRANSCRIBE_BACKEND = os.environ.get("TRANSCRIBE_BACKEND", "whisper")
+
+# Model names ending in this suffix, e.g. "medium-int8", are loaded with int8 weights. CPU only.
+INT8_SUFFIX = "-int8"
+# Quantized models are built once and saved here, so later loads, including the parallel workers, skip quantizing.
+INT8_CACHE_DIR = pathlib.Path(os.environ.get("INT8_CACHE_DIR", pathlib.Path(__file__).parent.absolute() / "cache" / "int8"))
+
+
+def split_name(name: str):
+    """Return (size, quantized) for a model name such as "small" or "small-int8"."""
+    if name.endswith(INT8_SUFFIX):
+        return name[:-len(INT8_SUFFIX)], True
+    return name, False
+
+
+def model_size_bytes(model) -> int:
+    # The state dict also holds the packed weights of quantized layers, which are not parameters.
+    total = 0
+    for value in model.state_dict().values():
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every linear layer, in place."""
+    # Whisper's Linear subclass only casts its weights to the input dtype, a no-op
+    # for fp32 on CPU. quantize_dynamic matches module types exactly, so the layers
+    # are turned back into plain nn.Linear first.
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def encoder_seconds(model) -> float:
+    """Time of one encoder pass over a 30 second window, a cheap proxy for decoding speed."""
+    mel = torch.zeros(1, model.dims.n_mels, 3000, device=model.device)
+    with torch.no_grad():
+        start = time.perf_counter()
+        model.encoder(mel)
+        return time.perf_counter() - start
+
+
+class WhisperBackend:
+    name = "whisper"
+
+    def load(self, name: str, device: str, profile: dict, benchmark: bool = True):
+        """
+        Load an openai-whisper model, quantized if the name ends in INT8_SUFFIX.
+        `profile` is filled with the parameter count and footprint, and for
+        quantized models with the fp32 footprint and, when the model is first
+        quantized with `benchmark`, encoder timings for comparison.
+        """
+        size, quantized = split_name(name)
+        if quantized:
+            model = self._load_int8(size, profile, benchmark)
+        else:
+            model = whisper.load_model(size, device=device)
+            profile["parameters"] = sum(p.numel() for p in model.parameters())
+        profile["mb"] = model_size_bytes(model) / 2**20
+        return model
+
+    def _load_int8(self, size: str, profile: dict, benchmark: bool):
+        # Keyed by the torch version, whose quantized modules the pickle refers to.
+        path = INT8_CACHE_DIR / f"{size}-torch{torch.__version__}.pt"
+        try:
+            model = torch.load(path, map_location="cpu", weights_only=False)
+            with open(path.with_suffix(".json"), encoding="utf8") as f:
+                profile.update(json.load(f))
+            return model
+        except (OSError, ValueError, RuntimeError, EOFError, pickle.UnpicklingError):
+            pass
+        model = whisper.load_model(size, device="cpu")
+        info = {"parameters": sum(p.numel() for p in model.parameters()), "fp32_mb": model_size_bytes(model) / 2**20}
+        if benchmark:
+            info["fp32_encoder_seconds"] = encoder_seconds(model)
+        model = quantize_int8(model)
+        if benchmark:
+            info["int8_encoder_seconds"] = encoder_seconds(model)
+        INT8_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp.with_suffix(".json"), "w", encoding="utf8") as f:
+            json.dump(info, f)
+        os.replace(tmp.with_suffix(".json"), path.with_suffix(".json"))
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+        profile.update(info)
+        return model
+
+    def detect_language(self, model, audio) -> str:
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(mel)
+        return max(probs, key=probs.get)
+
+
+class FasterWhisperModel:
+    """Adapter giving a faster_whisper.WhisperModel the openai-whisper transcribe() interface."""
+
+    # openai-whisper option names that faster-whisper spells differently, and ones it has no use for.
+    RENAMED = {"logprob_threshold": "log_prob_threshold"}
+    IGNORED = {"fp16", "verbose"}
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def is_multilingual(self) -> bool:
+        return self.model.model.is_multilingual
+
+    def transcribe(self, audio, **options) -> dict:
+        options = {self.RENAMED.get(k, k): v for k, v in options.items() if k not in self.IGNORED}
+        if isinstance(options.get("temperature"), tuple):
+            options["temperature"] = list(options["temperature"])
+        segments, info = self.model.transcribe(audio if isinstance(audio, np.ndarray) else str(audio), **options)
+        segments = [self._segment(i, segment) for i, segment in enumerate(segments)]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": info.language}
+
+    def detect_language(self, audio) -> str:
+        # The language is detected eagerly from the first 30 seconds; the segments are a lazy generator.
+        _, info = self.model.transcribe(audio[:whisper.audio.N_SAMPLES])
+        return info.language
+
+    @staticmethod
+    def _segment(index: int, segment) -> dict:
+        result = {
+            "id": index,
+            "seek": segment.seek,
+            "start": segment.start,
+            "end": segment.end,
+            "text": segment.text,
+            "tokens": list(segment.tokens),
+            "temperature": segment.temperature,
+            "avg_logprob": segment.avg_logprob,
+            "compression_ratio": segment.compression_ratio,
+            "no_speech_prob": segment.no_speech_prob,
+        }
+        if segment.words:
+            result["words"] = [{"word": w.word, "start": w.start, "end": w.end, "probability": w.probability}
+                               for w in segment.words]
+        return result
+
+
+class FasterWhisperBackend:
+    """
+    CTranslate2 engine through the optional faster-whisper package. Weights are
+    converted checkpoints from the Hugging Face hub; set HF_HUB_OFFLINE=1 to only
+    use the ones already in the local cache.
+    """
+
+    name = "faster-whisper"
+    # Bytes per weight of each compute type, relative to the float16 checkpoints on disk.
+    WEIGHT_SCALE = {"int8": 0.5, "float16": 1.0, "float32": 2.0}
+
+    def load(self, name: str, device: str, profile: dict, benchmark: bool = True):
+        try:
+            from faster_whisper import WhisperModel
+            from faster_whisper.utils import download_model
+        except ImportError as e:
+            raise ImportError("TRANSCRIBE_BACKEND=faster-whisper needs the faster-whisper package") from e
+        size, quantized = split_name(name)
+        compute_type = "int8" if quantized else "float16" if device == "cuda" else "float32"
+        path = download_model(size)
+        # CTranslate2 has its own thread pool; follow torch's setting, which the parallel workers lower.
+        model = WhisperModel(path, device=device, compute_type=compute_type, cpu_threads=torch.get_num_threads())
+        # Estimated from the checkpoint, CTranslate2 does not report its memory use.
+        disk = (pathlib.Path(path) / "model.bin").stat().st_size
+        profile["mb"] = disk * self.WEIGHT_SCALE[compute_type] / 2**20
+        return FasterWhisperModel(model)
+
+    def detect_language(self, model, audio) -> str:
+        return model.detect_language(audio)
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend(), FasterWhisperBackend())}
+
+
+def get_backend(name: str = TRANSCRIBE_BACKEND):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]
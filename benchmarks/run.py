@@ -0,0 +1,220 @@
+"""
+Offline CPU benchmarks for the subtitle writers, the ffmpeg stages and Whisper's real-time factor.
+
+    python benchmarks/run.py                      # run everything, compare with benchmarks/baseline.json
+    python benchmarks/run.py --only writers       # run one group
+    python benchmarks/run.py --save-baseline      # store this run as the new baseline
+
+Results are written as JSON (--output, default benchmarks/results.json). A benchmark is
+reported as a regression when it is more than --tolerance times slower than the baseline,
+and the exit code is 1 if any regressed. Test media is generated with ffmpeg's lavfi sources,
+and models whose weights are not in the local cache of their engine are skipped.
+--backend measures the real-time factor of each transcription engine in turn.
+"""
+import argparse
+import io
+import json
+import os
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import ffmpeg  # noqa: E402
+
+from media import BURN_WORKERS, SAMPLE_RATE, burn_in, decode_audio, extract_audio, mux_subtitles, parallel_burn_in  # noqa: E402
+from utils import format_timestamp, processText, write_srt, write_vtt  # noqa: E402
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+WORDS = "the quick brown fox jumps over the lazy dog while subtitles keep pace with every word spoken".split()
+
+
+def measure(fn, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min": min(times), "repeat": repeat}
+
+
+def synthetic_segments(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    segments, t = [], 0.0
+    for i in range(n):
+        duration = rng.uniform(1.0, 6.0)
+        text = " " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 24))) + rng.choice(".?!,")
+        segments.append({"id": i, "start": t, "end": t + duration, "text": text})
+        t += duration + rng.uniform(0.0, 0.5)
+    return segments
+
+
+def bench_writers(args):
+    for n in args.segments:
+        segments = synthetic_segments(n)
+        seconds = [s["start"] for s in segments]
+        texts = [s["text"] for s in segments]
+        yield f"format_timestamp[{n}]", measure(lambda: [format_timestamp(s, True, ",") for s in seconds], args.repeat)
+        yield f"processText[{n}]", measure(lambda: [processText(t, 42) for t in texts], args.repeat)
+        yield f"write_srt[{n}]", measure(lambda: write_srt(segments, io.StringIO(), maxLineWidth=80), args.repeat)
+        yield f"write_vtt[{n}]", measure(lambda: write_vtt(segments, io.StringIO(), maxLineWidth=80), args.repeat)
+
+
+def generate_media(work: pathlib.Path, seconds: float, size: str) -> pathlib.Path:
+    path = work / f"test_{seconds:g}s.mp4"
+    video = ffmpeg.input(f"testsrc2=size={size}:rate=25:duration={seconds}", f="lavfi")
+    audio = ffmpeg.input(f"sine=frequency=440:sample_rate=44100:duration={seconds}", f="lavfi")
+    ffmpeg.output(video, audio, str(path), vcodec="libx264", acodec="aac", pix_fmt="yuv420p", g=50) \
+        .run(quiet=True, overwrite_output=True)
+    return path
+
+
+def write_test_srt(work: pathlib.Path, seconds: float) -> pathlib.Path:
+    segments = [s for s in synthetic_segments(int(seconds)) if s["end"] <= seconds]
+    path = work / "test.srt"
+    with open(path, "w", encoding="utf8") as f:
+        write_srt(segments, f, maxLineWidth=42)
+    return path
+
+
+def bench_extract(args, work):
+    for seconds in args.media_seconds:
+        media = generate_media(work, seconds, args.video_size)
+        yield f"extract_audio_wav[{seconds:g}s]", measure(lambda: extract_audio(media, work / "out.wav"), args.repeat)
+        yield f"decode_audio_pipe[{seconds:g}s]", measure(lambda: decode_audio(media), args.repeat)
+
+
+def bench_burn(args, work):
+    for seconds in args.media_seconds:
+        media = generate_media(work, seconds, args.video_size)
+        srt = write_test_srt(work, seconds)
+        single = measure(lambda: burn_in(media, srt, work / "burned.mp4"), args.repeat)
+        yield f"burn_in[{seconds:g}s,{args.video_size}]", single
+        for workers in args.burn_workers:
+            result = measure(lambda: parallel_burn_in(media, srt, work / "burned.mp4", workers), args.repeat)
+            # Speedup over the single ffmpeg process above.
+            result["speedup"] = single["seconds"] / result["seconds"]
+            yield f"parallel_burn_in[{seconds:g}s,{args.video_size},{workers}w]", result
+        yield f"mux_subtitles[{seconds:g}s,{args.video_size}]", measure(lambda: mux_subtitles(media, srt, work / "muxed.mp4"), args.repeat)
+
+
+def cached_model_available(backend: str, name: str) -> bool:
+    from backends import split_name
+
+    size, _ = split_name(name)
+    if backend == "faster-whisper":
+        try:
+            from faster_whisper.utils import download_model
+            download_model(size, local_files_only=True)
+        except Exception:
+            return False
+        return True
+    import whisper
+    cache = pathlib.Path(os.getenv("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")) / "whisper"
+    url = whisper._MODELS.get(size)
+    return url is not None and (cache / os.path.basename(url)).exists()
+
+
+def bench_rtf(args, work):
+    import numpy as np
+    from backends import TRANSCRIBE_BACKEND, get_backend
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(args.audio_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    # Amplitude-modulated tones with noise: no speech, but it exercises the full decode loop.
+    audio = (0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2
+             + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+    for backend in args.backend or [TRANSCRIBE_BACKEND]:
+        engine = get_backend(backend)
+        for size in args.models:
+            # Named like the transcript cache names them, so openai-whisper keeps its baseline entries.
+            name = size if backend == "whisper" else f"{backend}/{size}"
+            if not cached_model_available(backend, size):
+                print(f"  skipping rtf[{name}]: weights not in the local {backend} cache", file=sys.stderr)
+                continue
+            model = engine.load(size, "cpu", {}, benchmark=False)
+            result = measure(lambda: model.transcribe(audio, language="en", fp16=False, temperature=0.0), args.repeat)
+            result["rtf"] = result["seconds"] / args.audio_seconds
+            yield f"transcribe_rtf[{name}]", result
+
+
+GROUPS = {"writers": bench_writers, "extract": bench_extract, "burn": bench_burn, "rtf": bench_rtf}
+NEEDS_MEDIA = {"extract", "burn"}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[name]["seconds"] if baseline[name]["seconds"] else 1.0
+        result["baseline_seconds"] = baseline[name]["seconds"]
+        result["ratio"] = ratio
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--segments", type=int, nargs="+", default=[100, 1_000, 10_000, 50_000])
+    parser.add_argument("--media-seconds", type=float, nargs="+", default=[10, 60])
+    parser.add_argument("--video-size", default="1280x720")
+    parser.add_argument("--burn-workers", type=int, nargs="+", default=[BURN_WORKERS])
+    parser.add_argument("--models", nargs="+", default=["tiny", "base", "small", "medium"],
+                        help="model names, with the -int8 suffix for int8 weights")
+    parser.add_argument("--backend", nargs="+", default=None,
+                        help="transcription engines to measure, e.g. whisper faster-whisper (default: TRANSCRIBE_BACKEND)")
+    parser.add_argument("--audio-seconds", type=float, default=30)
+    parser.add_argument("--output", default=str(BENCH_DIR / "results.json"))
+    parser.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        work = pathlib.Path(tmp)
+        for group in args.only:
+            if group in NEEDS_MEDIA and shutil.which("ffmpeg") is None:
+                print(f"skipping {group}: ffmpeg not found", file=sys.stderr)
+                continue
+            runner = GROUPS[group]
+            for name, result in (runner(args, work) if group != "writers" else runner(args)):
+                results[name] = result
+                speedup = f"  {result['speedup']:.2f}x" if "speedup" in result else ""
+                print(f"{name:40s} {result['seconds'] * 1000:12.2f} ms{speedup}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf8") as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    for name in regressions:
+        print(f"REGRESSION {name}: {results[name]['ratio']:.2f}x the baseline", file=sys.stderr)
+
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+        "regressions": regressions,
+    }
+    with open(args.output, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf8") as f:
+            json.dump({"machine": report["machine"], "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
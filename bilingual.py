@@ -0,0 +1,156 @@
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+from whisper.decoding import DecodingOptions
+from whisper.tokenizer import get_tokenizer
+
+from features import log_mel_spectrogram
+
+TASKS = ("transcribe", "translate")
+# Prompt tokens carried over from the previous window, as in whisper.transcribe().
+MAX_PROMPT_TOKENS = 223
+
+
+def split_segments(tokens: list, tokenizer, offset: float, frames: int, input_stride: int):
+    """
+    Cut the tokens decoded for one window into timestamped segments the way
+    whisper.transcribe() does. Returns ([(start, end, tokens)], frames consumed).
+    """
+    begin = tokenizer.timestamp_begin
+    precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+    is_timestamp = [token >= begin for token in tokens]
+    single_ending = is_timestamp[-2:] == [False, True]
+    consecutive = [i + 1 for i in range(len(tokens) - 1) if is_timestamp[i] and is_timestamp[i + 1]]
+    if not consecutive:
+        duration = frames * HOP_LENGTH / SAMPLE_RATE
+        timestamps = [token for token in tokens if token >= begin]
+        if timestamps and timestamps[-1] != begin:
+            duration = (timestamps[-1] - begin) * precision
+        return [(offset, offset + duration, tokens)], frames
+
+    slices = consecutive + ([len(tokens)] if single_ending else [])
+    pieces, last = [], 0
+    for current in slices:
+        piece = tokens[last:current]
+        pieces.append((offset + (piece[0] - begin) * precision, offset + (piece[-1] - begin) * precision, piece))
+        last = current
+    consumed = frames if single_ending else (tokens[last - 1] - begin) * input_stride
+    # An incomplete window ending on a timestamp at zero would never advance.
+    return pieces, consumed if consumed > 0 else frames
+
+
+class BilingualTranscriber:
+    """
+    Transcribe and translate to English in one pass. Each 30 second window is
+    encoded once and both token streams are decoded from the shared audio
+    features; whisper's decode() skips the encoder when it is given features
+    instead of a spectrogram. Windows advance as far as the transcription got,
+    and translated segments starting past that point are decoded again with
+    the next window.
+    """
+
+    def __init__(self, model, on_segment=None):
+        self.model = model
+        self.on_segment = on_segment
+
+    def transcribe(self, audio, language=None, temperature=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0), best_of=5, beam_size=None,
+                   condition_on_previous_text=True, fp16=True, compression_ratio_threshold=2.4, logprob_threshold=-1.0,
+                   no_speech_threshold=0.6, **_) -> dict:
+        """Returns {"transcribe": result, "translate": result, "language": code}, each result shaped like transcribe()'s."""
+        model = self.model
+        if not model.is_multilingual:
+            raise ValueError("Translation needs a multilingual model")
+        fp16 = fp16 and model.device.type != "cpu"
+        temperatures = (temperature,) if isinstance(temperature, (int, float)) else tuple(temperature)
+        self.settings = dict(temperatures=temperatures, best_of=best_of, beam_size=beam_size, fp16=fp16,
+                             compression_ratio_threshold=compression_ratio_threshold,
+                             logprob_threshold=logprob_threshold, no_speech_threshold=no_speech_threshold)
+
+        mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+        content_frames = mel.shape[-1] - N_FRAMES
+        duration = content_frames * HOP_LENGTH / SAMPLE_RATE
+        input_stride = N_FRAMES // model.dims.n_audio_ctx
+        step = input_stride * HOP_LENGTH / SAMPLE_RATE
+        segments = {task: [] for task in TASKS}
+        prompts = {task: [] for task in TASKS}
+        tokenizers = None
+
+        seek = 0
+        while seek < content_frames:
+            frames = min(N_FRAMES, content_frames - seek)
+            offset = seek * HOP_LENGTH / SAMPLE_RATE
+            window = whisper.pad_or_trim(mel[:, seek:seek + frames], N_FRAMES).to(model.device)
+            with torch.no_grad():
+                features = model.embed_audio(window.to(torch.float16 if fp16 else torch.float32).unsqueeze(0))
+            if language is None:
+                # detect_language() also accepts encoder output, so detection costs no extra encoder pass.
+                _, probs = model.detect_language(features)
+                language = max(probs[0], key=probs[0].get)
+            if tokenizers is None:
+                tokenizers = {task: get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                                  language=language, task=task) for task in TASKS}
+
+            advance = frames
+            cut = None
+            for task in TASKS:
+                tokenizer = tokenizers[task]
+                prompt = prompts[task] if condition_on_previous_text else []
+                result = self._decode(features, task, language, prompt)
+                if self._no_speech(result):
+                    break
+                pieces, consumed = split_segments(result.tokens, tokenizer, offset, frames, input_stride)
+                if task == "transcribe":
+                    advance = consumed
+                    cut = offset + advance * HOP_LENGTH / SAMPLE_RATE
+                for i, (start, end, tokens) in enumerate(pieces):
+                    # A translated piece running past the cut covers audio the next window translates again,
+                    # so it is left to that window. The window's first piece is kept so translation always advances,
+                    # and ends within one timestamp step of the cut count as on it.
+                    if task != "transcribe" and (start >= cut or (end > cut + step and i > 0)):
+                        break
+                    text = tokenizer.decode([token for token in tokens if token < tokenizer.eot])
+                    if not text.strip():
+                        continue
+                    segment = {
+                        "id": len(segments[task]), "seek": seek, "start": start,
+                        "end": min(end, cut) if task != "transcribe" else end, "text": text, "tokens": tokens,
+                        "temperature": result.temperature, "avg_logprob": result.avg_logprob,
+                        "compression_ratio": result.compression_ratio, "no_speech_prob": result.no_speech_prob,
+                    }
+                    segments[task].append(segment)
+                    prompts[task].extend(token for token in tokens if token < tokenizer.eot)
+                    if task == "transcribe" and self.on_segment is not None:
+                        self.on_segment(segment, duration)
+                prompts[task] = [] if result.temperature > 0.5 else prompts[task][-MAX_PROMPT_TOKENS:]
+            seek += advance
+
+        return {
+            **{task: {"text": "".join(s["text"] for s in segments[task]), "segments": segments[task], "language": language}
+               for task in TASKS},
+            "language": language,
+        }
+
+    def _decode(self, features, task, language, prompt):
+        # Temperature fallback as in whisper.transcribe(), reusing the same features for every attempt.
+        settings = self.settings
+        for temperature in settings["temperatures"]:
+            kwargs = dict(task=task, language=language, temperature=temperature, fp16=settings["fp16"], prompt=prompt or None)
+            if temperature > 0:
+                kwargs["best_of"] = settings["best_of"]
+            else:
+                kwargs["beam_size"] = settings["beam_size"]
+            result = self.model.decode(features, DecodingOptions(**kwargs))[0]
+            needs_fallback = (
+                (settings["compression_ratio_threshold"] is not None and result.compression_ratio > settings["compression_ratio_threshold"])
+                or (settings["logprob_threshold"] is not None and result.avg_logprob < settings["logprob_threshold"])
+            )
+            if settings["no_speech_threshold"] is not None and result.no_speech_prob > settings["no_speech_threshold"]:
+                needs_fallback = False
+            if not needs_fallback:
+                break
+        return result
+
+    def _no_speech(self, result) -> bool:
+        settings = self.settings
+        return (settings["no_speech_threshold"] is not None and result.no_speech_prob > settings["no_speech_threshold"]
+                and settings["logprob_threshold"] is not None and result.avg_logprob < settings["logprob_threshold"])
@@ -0,0 +1,179 @@
+"""
+Transcribe and subtitle media without the web UI.
+
+    python cli.py videos/ manifest.txt dQw4w9WgXcQ --output-dir out --model small --jobs 2 --video soft
+
+Inputs can be media files, directories (scanned for media files), YouTube links
+or video IDs, and manifests (.txt files listing any of these, one per line).
+Items whose outputs already exist are skipped unless --overwrite is given.
+--jobs overlaps the downloads and ffmpeg work of several items, but they share
+one model and transcribe one at a time; --parallel spreads each transcription
+across CPU worker processes instead.
+"""
+import argparse
+import csv
+import pathlib
+import re
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from media import SAMPLE_RATE, download_video
+from models import get_model, model_name
+from pipeline import BILINGUAL, TASKS, SUBTITLE_MODES, load_audio, transcribe, write_transcripts, generate_subtitled_video
+from profiles import PROFILE_CHOICES, resolve_profile
+from workspace import job_dir
+
+MEDIA_SUFFIXES = {".mp4", ".m4v", ".mov", ".mkv", ".avi", ".webm", ".mp3", ".wav", ".m4a", ".flac", ".ogg"}
+VIDEO_SUFFIXES = {".mp4", ".m4v", ".mov", ".mkv", ".avi", ".webm"}
+YOUTUBE_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_URL = re.compile(r"^https?://(www\.|m\.)?(youtube\.com|youtu\.be)/")
+REPORT_FIELDS = ["item", "status", "language", "download_s", "decode_s", "transcribe_s", "write_s", "video_s", "total_s", "error"]
+
+
+class Item:
+    def __init__(self, source: str, youtube: bool):
+        self.source = source
+        self.youtube = youtube
+
+    @property
+    def name(self) -> str:
+        if self.youtube:
+            match = re.search(r"(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})", self.source)
+            return match.group(1) if match else re.sub(r"\W+", "_", self.source)[-32:]
+        return pathlib.Path(self.source).stem
+
+
+def collect_items(inputs) -> list:
+    items = []
+    for entry in inputs:
+        entry = entry.strip()
+        if not entry or entry.startswith("#"):
+            continue
+        path = pathlib.Path(entry)
+        if YOUTUBE_URL.match(entry):
+            items.append(Item(entry, youtube=True))
+        elif path.is_dir():
+            items.extend(Item(str(p), youtube=False) for p in sorted(path.rglob("*")) if p.suffix.lower() in MEDIA_SUFFIXES)
+        elif path.is_file() and path.suffix.lower() == ".txt":
+            with open(path, encoding="utf8") as f:
+                items.extend(collect_items(f.read().splitlines()))
+        elif path.is_file():
+            items.append(Item(entry, youtube=False))
+        elif YOUTUBE_ID.match(entry):
+            items.append(Item(f"https://www.youtube.com/watch?v={entry}", youtube=True))
+        else:
+            print(f"Skipping {entry}: not a file, directory, manifest or YouTube link", file=sys.stderr)
+    return items
+
+
+def expected_outputs(item: Item, args) -> list:
+    out = pathlib.Path(args.output_dir)
+    outputs = [out / f"{item.name}.{fmt}" for fmt in ("txt", "vtt", "srt")]
+    if TASKS[args.task] == BILINGUAL:
+        outputs += [out / f"{item.name}.en.{fmt}" for fmt in ("txt", "vtt", "srt")]
+    if args.video != "none" and (item.youtube or pathlib.Path(item.source).suffix.lower() in VIDEO_SUFFIXES):
+        outputs.append(out / f"{item.name}_with_subs")
+    return outputs
+
+
+def outputs_exist(outputs) -> bool:
+    # The subtitled video's extension depends on the source container, so it is matched by stem.
+    return all(path.exists() or any(path.parent.glob(f"{path.name}.*")) for path in outputs)
+
+
+def process(item: Item, args) -> dict:
+    row = {"item": item.source, "status": "done"}
+    outputs = expected_outputs(item, args)
+    if not args.overwrite and outputs_exist(outputs):
+        row["status"] = "skipped"
+        return row
+
+    started = time.perf_counter()
+    out = pathlib.Path(args.output_dir)
+    try:
+        with job_dir("cli") as work:
+            t = time.perf_counter()
+            video = download_video(item.source, work) if item.youtube else item.source
+            row["download_s"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            audio, digest = load_audio(video)
+            row["decode_s"] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            size, options, _ = resolve_profile(args.profile, model_name(args.model, args.int8), len(audio) / SAMPLE_RATE,
+                                               args.deadline * 60, args.int8, args.parallel)
+            translation = {}
+            text, vtt, srt, lang = transcribe(get_model(size), size, audio, args.task, args.parallel,
+                                              sentences=not args.raw_text, digest=digest, decode_options=options, translation=translation)
+            row["transcribe_s"] = time.perf_counter() - t
+            row["language"] = lang
+
+            t = time.perf_counter()
+            files = write_transcripts(text, vtt, srt, work)
+            for fmt, path in files.items():
+                shutil.copyfile(path, out / f"{item.name}.{fmt}")
+            for fmt, contents in translation.items():
+                with open(out / f"{item.name}.en.{fmt}", "w", encoding="utf8") as f:
+                    f.write(contents)
+            row["write_s"] = time.perf_counter() - t
+
+            if outputs[-1].name.endswith("_with_subs"):
+                t = time.perf_counter()
+                subtitled = generate_subtitled_video(video, files["srt"], work / "subtitled.mp4", args.video)
+                shutil.move(subtitled, out / f"{item.name}_with_subs{pathlib.Path(subtitled).suffix}")
+                row["video_s"] = time.perf_counter() - t
+    except Exception as e:
+        row["status"] = "failed"
+        row["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    row["total_s"] = time.perf_counter() - started
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch transcription and subtitling.")
+    parser.add_argument("inputs", nargs="+", help="media files, directories, manifests (.txt), YouTube links or IDs")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--model", default="small", choices=["tiny", "base", "small", "medium", "large", "large-v3"])
+    parser.add_argument("--task", default="Transcribe", choices=list(TASKS))
+    parser.add_argument("--video", default="none", choices=["none", *SUBTITLE_MODES.values()],
+                        help="also write a subtitled video for video inputs")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="items processed at the same time; only downloads and ffmpeg work overlap, "
+                             "transcriptions share one model and run in turn (see --parallel)")
+    parser.add_argument("--profile", default="custom", choices=PROFILE_CHOICES,
+                        help="decode profile; custom uses --model, auto picks one per item to finish within --deadline")
+    parser.add_argument("--deadline", type=float, default=10, help="target transcription minutes per item for --profile auto")
+    parser.add_argument("--int8", action="store_true", help="use an int8 quantized model (CPU only)")
+    parser.add_argument("--parallel", action="store_true", help="split each item across CPU worker processes")
+    parser.add_argument("--raw-text", action="store_true", help="write the .txt as raw text instead of one sentence per paragraph")
+    parser.add_argument("--overwrite", action="store_true", help="process items even if their outputs exist")
+    parser.add_argument("--report", default=None, help="CSV timing report (default: <output-dir>/report.csv)")
+    args = parser.parse_args(argv)
+
+    items = collect_items(args.inputs)
+    pathlib.Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    report = args.report or str(pathlib.Path(args.output_dir) / "report.csv")
+    print(f"{len(items)} items, {args.jobs} at a time")
+    failed = 0
+
+    with open(report, "w", newline="", encoding="utf8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            for row in pool.map(lambda item: process(item, args), items):
+                writer.writerow({k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()})
+                f.flush()
+                print(f"[{row['status']}] {row['item']} ({row.get('total_s', 0):.1f}s)")
+                failed += row["status"] == "failed"
+
+    print(f"Timing report written to {report}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+import pathlib
+import shutil
+import threading
+
+
+def tmp_path(path, suffix: str = "") -> pathlib.Path:
+    """Private name next to `path` for writing an entry before commit() moves it into place."""
+    path = pathlib.Path(path)
+    return path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}")
+
+
+class LRUDirectory:
+    """
+    Directory of cache entries, the files or directories matching `ENTRIES`
+    under the root, kept within `max_bytes` by removing the least recently
+    used entries first. An entry's mtime is its last use: readers touch() it,
+    and writers commit() a finished entry written under tmp_path().
+    """
+
+    ENTRIES = "*/*"
+
+    def __init__(self, root, max_bytes: int):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            # Another job evicted the entry since it was read; what was read is still good.
+            pass
+
+    def commit(self, tmp, path):
+        """Replace the entry at `path` with `tmp`, then evict down to the budget."""
+        with self._lock:
+            if os.path.isdir(tmp):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for path in self.root.glob(self.ENTRIES):
+                # Entries still being written are not counted until they are committed.
+                if ".tmp" in path.suffixes:
+                    continue
+                try:
+                    stat = path.stat()
+                    size = sum(f.stat().st_size for f in path.iterdir()) if path.is_dir() else stat.st_size
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+                total -= size
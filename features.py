@@ -0,0 +1,127 @@
+import importlib
+import os
+import pathlib
+import threading
+import weakref
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES
+
+from disk_cache import LRUDirectory, tmp_path
+
+FEATURE_CACHE_DIR = pathlib.Path(os.environ.get("FEATURE_CACHE_DIR", pathlib.Path(__file__).parent.absolute() / "cache" / "features"))
+# Total size of the cached PCM and log-mel arrays, in megabytes, before the least recently used audio is removed.
+FEATURE_CACHE_MB = int(os.environ.get("FEATURE_CACHE_MB", "4096"))
+
+
+class FeatureCache(LRUDirectory):
+    """
+    Decoded 16 kHz PCM and log-mel spectrograms stored once per audio digest as
+    .npy files and opened memory-mapped, so any model size or task on the same
+    audio reuses them without decoding or recomputing. Each digest's directory
+    is one entry.
+    """
+
+    def __init__(self, root, max_bytes: int):
+        super().__init__(root, max_bytes)
+        self._registered_lock = threading.Lock()
+        self._registered = {}
+
+    def _dir(self, digest: str) -> pathlib.Path:
+        return self.root / digest[:2] / digest
+
+    def _load(self, path: pathlib.Path):
+        try:
+            # Copy-on-write mapping: pages are shared between readers and nothing is written back.
+            array = np.load(path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        self.touch(path.parent)
+        return array
+
+    def _store(self, path: pathlib.Path, array: np.ndarray):
+        tmp = tmp_path(path, ".npy")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(tmp, array)
+            self.commit(tmp, path)
+        except OSError:
+            # A concurrent eviction removed the directory; the caller still has the array in memory.
+            tmp.unlink(missing_ok=True)
+
+    def pcm(self, digest: str):
+        return self._load(self._dir(digest) / "pcm.npy")
+
+    def put_pcm(self, digest: str, audio: np.ndarray):
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        self._store(self._dir(digest) / "pcm.npy", audio)
+        # The entry may already be evicted again, by another job or for being larger than the whole cache.
+        cached = self.pcm(digest)
+        return audio if cached is None else cached
+
+    def mel(self, digest: str, audio: np.ndarray, n_mels: int):
+        """Log-mel spectrogram of the whole audio, padded like whisper.transcribe() pads it."""
+        path = self._dir(digest) / f"mel{n_mels}.npy"
+        mel = self._load(path)
+        if mel is None:
+            computed = _original_log_mel_spectrogram(audio, n_mels, padding=N_SAMPLES).numpy()
+            self._store(path, computed)
+            mel = self._load(path)
+            if mel is None:
+                mel = computed
+        return mel
+
+    def register(self, audio: np.ndarray, digest: str):
+        """Let the log-mel hook recognize `audio`, and views into it, as the audio stored under `digest`."""
+        key = id(audio)
+        with self._registered_lock:
+            self._registered[key] = (digest, weakref.ref(audio))
+        weakref.finalize(audio, self._unregister, key)
+
+    def _unregister(self, key):
+        with self._registered_lock:
+            self._registered.pop(key, None)
+
+    def lookup(self, audio: np.ndarray):
+        """Return (digest, root array, first sample) if `audio` is registered or a contiguous view into such an array."""
+        array = audio
+        while isinstance(array, np.ndarray):
+            with self._registered_lock:
+                entry = self._registered.get(id(array))
+            if entry is not None and entry[1]() is array:
+                digest, root = entry[0], array
+                if audio.dtype != root.dtype or audio.strides != root.strides:
+                    return None
+                return digest, root, (audio.ctypes.data - root.ctypes.data) // root.itemsize
+            array = array.base
+        return None
+
+
+feature_cache = FeatureCache(FEATURE_CACHE_DIR, FEATURE_CACHE_MB * 2**20)
+
+_transcribe_module = importlib.import_module("whisper.transcribe")
+_original_log_mel_spectrogram = whisper.audio.log_mel_spectrogram
+
+
+def log_mel_spectrogram(audio, n_mels: int = 80, padding: int = 0, device=None):
+    """
+    Drop-in for whisper's log_mel_spectrogram that serves registered audio from
+    the feature cache. A view starting on a mel frame boundary gets the matching
+    frames of the cached spectrogram followed by its padding frames; the only
+    difference from computing it directly is that the dynamic range floor comes
+    from the whole audio instead of the window.
+    """
+    found = feature_cache.lookup(audio) if isinstance(audio, np.ndarray) and padding == N_SAMPLES else None
+    if found is None or found[2] % HOP_LENGTH:
+        return _original_log_mel_spectrogram(audio, n_mels, padding, device)
+    digest, root, start = found
+    mel = feature_cache.mel(digest, root, n_mels)
+    first = start // HOP_LENGTH
+    frames = torch.from_numpy(np.concatenate([mel[:, first:first + len(audio) // HOP_LENGTH], mel[:, -N_FRAMES:]], axis=1))
+    return frames if device is None else frames.to(device)
+
+
+# whisper.transcribe() calls the copy imported into its own module.
+_transcribe_module.log_mel_spectrogram = log_mel_spectrogram
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import job_finished
+from workspace import JOBS_DIR, new_job_dir
+
+# Number of transcriptions/burn-ins allowed to run at the same time. Everything
+# else waits in the queue, so size this to the CPU/GPU memory of the host.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """State of one background job. Every update is mirrored to status.json in the job directory."""
+
+    def __init__(self, kind: str):
+        self.dir = new_job_dir(kind)
+        self.id = self.dir.name
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a free worker..."
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.stages = []
+        self._save()
+
+    def update(self, progress: float = None, message: str = None):
+        if progress is not None:
+            self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        self._save()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "stages": self.stages,
+        }
+
+    def _save(self):
+        tmp = self.dir / "status.json.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(self.to_dict(), f, default=str)
+        os.replace(tmp, self.dir / "status.json")
+
+    @classmethod
+    def load(cls, job_id: str):
+        path = JOBS_DIR / job_id / "status.json"
+        try:
+            with open(path, encoding="utf8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls.__new__(cls)
+        job.dir = path.parent
+        job.stages = []
+        job.__dict__.update(state)
+        # A job that was queued or running when its process died will never finish.
+        if job.status in (QUEUED, RUNNING):
+            job.status = FAILED
+            job.error = "The server restarted before the job finished."
+        return job
+
+
+class JobQueue:
+    """Bounded worker pool shared by all sessions. Pages keep only the job id and poll for status."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn, *args, **kwargs) -> str:
+        """Run `fn(job, *args, **kwargs)` on a worker. Its return value becomes `job.result`."""
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        job.update(message="Starting...")
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+            job.update(1.0, "Done")
+        except Exception as e:
+            job.status = FAILED
+            job.error = f"{type(e).__name__}: {e}"
+            job.update(message="Failed")
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            job._save()
+            job_finished(job)
+
+    def _prune(self, max_age: float = 3600):
+        # Finished jobs are dropped from memory after a while; get() can still read them from disk.
+        cutoff = time.time() - max_age
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = Job.load(job_id)
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": self.max_workers,
+            "queued": sum(job.status == QUEUED for job in jobs),
+            "running": sum(job.status == RUNNING for job in jobs),
+        }
+
+
+queue = JobQueue(JOB_WORKERS)
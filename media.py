@@ -0,0 +1,228 @@
+import os
+import pathlib
+import shutil
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+import numpy as np
+from pytubefix import YouTube
+from pytubefix.cli import on_progress
+
+from utils import iter_cues, render_subtitles, shift_cues
+
+SAMPLE_RATE = 16000
+MP4_SUFFIXES = (".mp4", ".m4v", ".mov")
+
+# x264 preset and quality (lower CRF is better and larger) of full-quality burn-ins.
+BURN_PRESET = os.environ.get("BURN_PRESET", "medium")
+BURN_CRF = int(os.environ.get("BURN_CRF", "23"))
+# Encoder threads per ffmpeg process, 0 lets x264 decide.
+BURN_THREADS = int(os.environ.get("BURN_THREADS", "0"))
+# Video encoder of every burn-in. Incremental re-burns splice newly encoded ranges
+# into an earlier output, so both must come from the same encoder settings.
+BURN_ENCODER = {"vcodec": "libx264", "preset": BURN_PRESET, "crf": BURN_CRF}
+# Seconds between forced keyframes of burned videos. A re-burn re-encodes whole keyframe intervals.
+BURN_KEYFRAME_SECONDS = 2
+# Number of ffmpeg processes a parallel burn-in splits the video between.
+BURN_WORKERS = int(os.environ.get("BURN_WORKERS", str(max(1, min(8, os.cpu_count() or 1)))))
+
+# Burned-in previews: picture height, length from the start of the video (0 for all of it) and x264 CRF.
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", "360"))
+PREVIEW_SECONDS = float(os.environ.get("PREVIEW_SECONDS", "120"))
+PREVIEW_CRF = 28
+
+
+def extract_audio(src, dst, sample_rate: int = SAMPLE_RATE):
+    """Decode the audio track of `src` to mono 16-bit PCM WAV, the format Whisper resamples to anyway."""
+    stream = ffmpeg.input(str(src))
+    stream = ffmpeg.output(stream.audio, str(dst), acodec="pcm_s16le", ac=1, ar=sample_rate)
+    ffmpeg.run(stream, quiet=True, overwrite_output=True)
+    return str(dst)
+
+
+def download_video(link, work):
+    yt = YouTube(link, on_progress_callback=on_progress)
+    ys = yt.streams.get_highest_resolution()
+    video = ys.download(filename=f"{work}/youtube_video.mp4")
+    return video
+
+
+def decode_audio(src, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode the audio track of `src` to mono float32 PCM in memory. ffmpeg writes
+    the samples to a pipe, so no intermediate WAV is written or decoded again.
+    """
+    out, _ = (
+        ffmpeg.input(str(src))
+        .output("pipe:", format="f32le", acodec="pcm_f32le", ac=1, ar=sample_rate)
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, np.float32)
+
+
+def output_container(video, output) -> pathlib.Path:
+    # Streams copied from the source must fit the output container: MP4/MOV
+    # sources stay MP4, anything else (AVI, MKV, WebM...) is written as MKV.
+    if pathlib.Path(video).suffix.lower() in MP4_SUFFIXES:
+        return pathlib.Path(output).with_suffix(".mp4")
+    return pathlib.Path(output).with_suffix(".mkv")
+
+
+def mux_subtitles(video, transcript, output):
+    """
+    Add `transcript` to `video` as a selectable subtitle track. Video and audio are
+    stream-copied, so this takes seconds regardless of the video length.
+    MP4/MOV sources keep their container (mov_text), anything else is written as MKV.
+    """
+    output = output_container(video, output)
+    scodec = "mov_text" if output.suffix == ".mp4" else "srt"
+    video_in = ffmpeg.input(str(video))
+    subs_in = ffmpeg.input(str(transcript))
+    ffmpeg.output(video_in["v"], video_in["a?"], subs_in, str(output), vcodec="copy", acodec="copy", scodec=scodec) \
+        .run(quiet=True, overwrite_output=True)
+    return output
+
+
+def burn_in(video, transcript, output):
+    """
+    Render `transcript` into the picture. Only the video stream is re-encoded;
+    the source audio track is copied as is.
+    """
+    output = output_container(video, output)
+    video_in = ffmpeg.input(str(video))
+    ffmpeg.output(video_in.video.filter("subtitles", str(transcript)), video_in["a?"], str(output), acodec="copy",
+                  **burn_options()) \
+        .run(quiet=True, overwrite_output=True)
+    return output
+
+
+def write_cues(cues: list, path):
+    """Write parsed cues as an SRT file for the subtitles filter."""
+    with open(path, "w", encoding="utf8") as f:
+        f.write(render_subtitles(cues, formats=("srt",))["srt"])
+    return path
+
+
+def burn_options() -> dict:
+    options = dict(BURN_ENCODER, force_key_frames=f"expr:gte(t,n_forced*{BURN_KEYFRAME_SECONDS})")
+    if BURN_THREADS:
+        options["threads"] = BURN_THREADS
+    return options
+
+
+def preview_burn_in(video, transcript, output, seconds: float = PREVIEW_SECONDS, height: int = PREVIEW_HEIGHT):
+    """
+    Quick look at the burned-in subtitles: the first `seconds` of `video` (all
+    of it if 0), scaled to `height` lines and encoded with x264's ultrafast
+    preset. The audio is copied.
+    """
+    output = output_container(video, output)
+    video_in = ffmpeg.input(str(video), **({"t": seconds} if seconds else {}))
+    # Scaled before the subtitles filter, so the text is drawn at the preview size instead of being shrunk with the picture.
+    stream = video_in.video.filter("scale", -2, height).filter("subtitles", str(transcript))
+    ffmpeg.output(stream, video_in["a?"], str(output), vcodec="libx264", preset="ultrafast", crf=PREVIEW_CRF, acodec="copy") \
+        .run(quiet=True, overwrite_output=True)
+    return output
+
+
+def keyframes(video):
+    """
+    Return (keyframe times, duration) of the video track of `video`, in seconds
+    from its start. Only packet headers are read, nothing is decoded.
+    """
+    info = ffmpeg.probe(str(video), select_streams="v:0", show_entries="packet=pts_time,flags")
+    start = float(info["format"].get("start_time", 0))
+    times = sorted(float(packet["pts_time"]) - start for packet in info["packets"]
+                   if "K" in packet.get("flags", "") and packet.get("pts_time", "N/A") != "N/A")
+    return times, float(info["format"]["duration"])
+
+
+def split_video(video, times, pattern):
+    """
+    Stream-copy the video track of `video` into MPEG-TS pieces named after
+    `pattern` (e.g. "part%04d.ts"), cutting at the keyframes at `times`.
+    """
+    # Cut a millisecond early so rounding in the probed times cannot push a cut to the next keyframe.
+    cuts = ",".join(f"{max(t - 0.001, 0):.6f}" for t in times)
+    ffmpeg.input(str(video)).video.output(str(pattern), c="copy", f="segment", segment_format="mpegts",
+                                          segment_times=cuts, reset_timestamps=1) \
+        .run(quiet=True, overwrite_output=True)
+
+
+def burn_range(video, transcript, output, start: float, end: float = None, **options):
+    """
+    Burn `transcript`, timed from `start`, into the frames of `video` between
+    `start` and `end` (the end of the video if None). Writes video only, as
+    MPEG-TS. Without a transcript the frames are only re-encoded. `options`
+    are extra ffmpeg output options.
+    """
+    video_in = ffmpeg.input(str(video), ss=start, **({} if end is None else {"t": end - start}))
+    stream = video_in.video if transcript is None else video_in.video.filter("subtitles", str(transcript))
+    ffmpeg.output(stream, str(output), f="mpegts", **{**burn_options(), **options}) \
+        .run(quiet=True, overwrite_output=True)
+    return output
+
+
+def splice(parts, audio_source, output):
+    """
+    Join the video pieces `parts`, a list of (path, duration), with the concat
+    demuxer and add the audio of `audio_source`. Everything is stream-copied.
+    """
+    listing = pathlib.Path(output).with_suffix(".concat.txt")
+    with open(listing, "w", encoding="utf8") as f:
+        for path, duration in parts:
+            escaped = str(pathlib.Path(path).absolute()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\nduration {duration:.6f}\n")
+    parts_in = ffmpeg.input(str(listing), f="concat", safe=0)
+    audio_in = ffmpeg.input(str(audio_source))
+    ffmpeg.output(parts_in.video, audio_in["a?"], str(output), c="copy").run(quiet=True, overwrite_output=True)
+    return output
+
+
+def segment_cuts(bounds: list, duration: float, parts: int) -> list:
+    """Keyframe times closest to dividing `duration` seconds into `parts` equal pieces."""
+    cuts = set()
+    for k in range(1, parts):
+        target = duration * k / parts
+        i = bisect_left(bounds, target)
+        nearest = min(bounds[max(i - 1, 0):i + 1], key=lambda t: abs(t - target), default=None)
+        if nearest is not None and 0 < nearest < duration:
+            cuts.add(nearest)
+    return sorted(cuts)
+
+
+def parallel_burn_in(video, transcript, output, workers: int = BURN_WORKERS):
+    """
+    burn_in() split across `workers` ffmpeg processes. The video is cut at the
+    keyframes nearest to equal shares, each piece is burned with the cues
+    shifted to its start, and the pieces are joined without re-encoding
+    before the source audio is copied in. Falls back to burn_in() when the
+    video cannot be split.
+    """
+    output = output_container(video, output)
+    bounds, duration = keyframes(video)
+    edges = [0.0, *segment_cuts(bounds, duration, workers), duration]
+    if len(edges) < 3:
+        return burn_in(video, transcript, output)
+    with open(transcript, encoding="utf-8-sig") as f:
+        cues = list(iter_cues(f))
+    parts_dir = output.with_name(f"{output.stem}_parts")
+    parts_dir.mkdir(exist_ok=True)
+    # Each ffmpeg process gets an equal share of the cores instead of all of them.
+    threads = BURN_THREADS or max(1, (os.cpu_count() or 1) // (len(edges) - 1))
+
+    def burn_part(i):
+        start, end = edges[i], edges[i + 1]
+        shown = shift_cues(cues, start, end)
+        subtitles = write_cues(shown, parts_dir / f"part{i:04d}.srt") if shown else None
+        path = burn_range(video, subtitles, parts_dir / f"part{i:04d}.ts", start, end if i < len(edges) - 2 else None,
+                          threads=threads)
+        return path, end - start
+
+    # The encoding runs in the ffmpeg child processes; the threads only wait for them.
+    with ThreadPoolExecutor(len(edges) - 1) as pool:
+        parts = list(pool.map(burn_part, range(len(edges) - 1)))
+    splice(parts, video, output)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    return output
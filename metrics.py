@@ -0,0 +1,150 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus exposition of per-stage timings. METRICS_TEXTFILE is rewritten
+# after every job (for node_exporter's textfile collector), METRICS_PORT serves
+# the same text over HTTP on localhost. Both are off by default.
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+class Histogram:
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Process-wide stage and job metrics, shared by every page and session like the model registry."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = {}
+        self.stage_bytes = {}
+        self.stage_audio_seconds = {}
+        self.job_seconds = {}
+        self.jobs = {}
+
+    def observe_stage(self, kind: str, record: dict):
+        key = (kind, record["stage"])
+        with self._lock:
+            self.stage_seconds.setdefault(key, Histogram()).observe(record["seconds"])
+            self.stage_bytes[key] = self.stage_bytes.get(key, 0) + record.get("bytes", 0)
+            self.stage_audio_seconds[key] = self.stage_audio_seconds.get(key, 0.0) + record.get("audio_seconds", 0.0)
+
+    def observe_job(self, kind: str, status: str, seconds: float):
+        with self._lock:
+            self.jobs[(kind, status)] = self.jobs.get((kind, status), 0) + 1
+            self.job_seconds.setdefault(kind, Histogram()).observe(seconds)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP subtitler_stage_seconds Time spent in each pipeline stage.",
+                "# TYPE subtitler_stage_seconds histogram",
+            ]
+            for (kind, stage), hist in sorted(self.stage_seconds.items()):
+                lines += hist.render("subtitler_stage_seconds", _labels(kind=kind, stage=stage))
+            lines += [
+                "# HELP subtitler_stage_bytes_total Bytes produced or consumed by each pipeline stage.",
+                "# TYPE subtitler_stage_bytes_total counter",
+            ]
+            lines += [f"subtitler_stage_bytes_total{{{_labels(kind=k, stage=s)}}} {v}" for (k, s), v in sorted(self.stage_bytes.items())]
+            lines += [
+                "# HELP subtitler_stage_audio_seconds_total Seconds of audio handled by each pipeline stage.",
+                "# TYPE subtitler_stage_audio_seconds_total counter",
+            ]
+            lines += [f"subtitler_stage_audio_seconds_total{{{_labels(kind=k, stage=s)}}} {v}"
+                      for (k, s), v in sorted(self.stage_audio_seconds.items())]
+            lines += ["# HELP subtitler_jobs_total Finished jobs by outcome.", "# TYPE subtitler_jobs_total counter"]
+            lines += [f"subtitler_jobs_total{{{_labels(kind=k, status=s)}}} {v}" for (k, s), v in sorted(self.jobs.items())]
+            lines += ["# HELP subtitler_job_seconds End-to-end job duration.", "# TYPE subtitler_job_seconds histogram"]
+            for kind, hist in sorted(self.job_seconds.items()):
+                lines += hist.render("subtitler_job_seconds", _labels(kind=kind))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def stage(job, name: str, **sizes):
+    """
+    Time one stage of `job` and record it in `job.stages` and the process metrics.
+    The yielded dict can be updated with `bytes` and `audio_seconds` once known.
+    `job` may be None, in which case the stage is only timed.
+    """
+    record = {"stage": name, **sizes}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        if job is not None:
+            job.stages.append(record)
+            metrics.observe_stage(job.kind, record)
+
+
+def job_finished(job):
+    metrics.observe_job(job.kind, job.status, job.finished - job.created)
+    if METRICS_TEXTFILE:
+        metrics.write_textfile(METRICS_TEXTFILE)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int):
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+if METRICS_PORT:
+    serve(METRICS_PORT)
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import torch
+
+from backends import INT8_SUFFIX, get_backend
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# RAM budget for resident Whisper weights, in megabytes. Least recently used
+# models are dropped once the total goes over it.
+MODEL_CACHE_MB = int(os.environ.get("WHISPER_MODEL_CACHE_MB", "4096"))
+
+# Model names ending in INT8_SUFFIX, e.g. "medium-int8", are loaded with int8
+# weights. CPU only. WHISPER_INT8=1 makes it the default.
+INT8_DEFAULT = os.environ.get("WHISPER_INT8", "0") == "1"
+
+
+def load_model(name: str, device: str = DEVICE, profile: dict = None, benchmark: bool = True):
+    """
+    Load a model by name with the configured backend, see backends.py.
+    Without `benchmark` no encoder timings are measured for the profile.
+    """
+    return get_backend().load(name, device, {} if profile is None else profile, benchmark)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models keyed by (size, device).
+    Streamlit keeps imported modules alive between reruns and sessions, so a
+    single instance of this class is shared by every page and every user.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times = {}
+        self.profiles = {}
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, size: str, device: str = DEVICE):
+        key = (size, device)
+        with self._lock:
+            if key in self._models:
+                return self._hit(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model, the others wait and reuse it.
+        with key_lock:
+            with self._lock:
+                if key in self._models:
+                    return self._hit(key)
+            start = time.perf_counter()
+            profile = {}
+            model = load_model(size, device, profile)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.misses += 1
+                self.load_times[key] = elapsed
+                self.profiles[key] = profile
+                self._models[key] = (model, int(profile["mb"] * 2**20))
+                self._evict()
+        return model
+
+    def _hit(self, key):
+        self.hits += 1
+        self._models.move_to_end(key)
+        return self._models[key][0]
+
+    def _evict(self):
+        evicted = False
+        # The most recently loaded model always stays, even if it alone exceeds the budget.
+        while len(self._models) > 1 and self.resident_bytes() > self.budget_bytes:
+            self._models.popitem(last=False)
+            self.evictions += 1
+            evicted = True
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def resident_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._models.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "resident": [f"{size}@{device}" for size, device in self._models],
+                "resident_mb": self.resident_bytes() / 2**20,
+                "budget_mb": self.budget_bytes / 2**20,
+                "load_seconds": {f"{size}@{device}": round(t, 2) for (size, device), t in self.load_times.items()},
+            }
+
+
+registry = ModelRegistry(MODEL_CACHE_MB * 2**20)
+
+
+def get_model(size: str, device: str = DEVICE):
+    # Quantized models always run on the CPU.
+    return registry.get(size, "cpu" if size.endswith(INT8_SUFFIX) else device)
+
+
+def model_profile(size: str, device: str = DEVICE) -> dict:
+    """Footprint and timings recorded when `size` was loaded, see load_model()."""
+    return registry.profiles.get((size, "cpu" if size.endswith(INT8_SUFFIX) else device), {})
+
+
+def model_name(size: str, int8: bool) -> str:
+    return f"{size}{INT8_SUFFIX}" if int8 else size
+
+
+_model_locks = weakref.WeakKeyDictionary()
+_model_locks_guard = threading.Lock()
+
+
+def model_lock(model) -> threading.Lock:
+    """
+    Lock to hold while decoding with a shared model. Whisper installs kv-cache
+    hooks on the model for the duration of each decode, so two threads decoding
+    on the same instance would corrupt each other's caches.
+    """
+    with _model_locks_guard:
+        if model not in _model_locks:
+            _model_locks[model] = threading.Lock()
+        return _model_locks[model]
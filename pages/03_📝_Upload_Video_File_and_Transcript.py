@@ -1,16 +1,15 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
-from utils import write_vtt, write_srt
-import ffmpeg
+from pipeline import SUBTITLE_MODES, generate_subtitled_video
+from jobs import queue
+from metrics import stage
+from reburn import reburn
+from ui import job_status, video_source, zip_download
+from utils import CueIndex, iter_cues
+from workspace import spool_upload
+import codecs
 import requests
-from typing import Iterator
-from io import StringIO
-import numpy as np
 import pathlib
-import os
-from zipfile import ZipFile
-from io import BytesIO
-import base64
 
 st.set_page_config(page_title="Auto Subtitled Video Generator", page_icon=":movie_camera:", layout="wide")
 
@@ -23,14 +22,6 @@ def load_lottieurl(url: str):
     return r.json()
 
 
-APP_DIR = pathlib.Path(__file__).parent.absolute()
-
-LOCAL_DIR = APP_DIR / "local_transcript"
-LOCAL_DIR.mkdir(exist_ok=True)
-save_dir = LOCAL_DIR / "output"
-save_dir.mkdir(exist_ok=True)
-
-
 col1, col2 = st.columns([1, 3])
 with col1:
     lottie = load_lottieurl("https://assets6.lottiefiles.com/packages/lf20_cjnxwrkt.json")
@@ -43,26 +34,54 @@ with col2:
     ##### ➠ Processing time will increase as the video length increases. """)
 
 
-def getSubs(segments: Iterator[dict], format: str, maxLineWidth: int) -> str:
-    segmentStream = StringIO()
-
-    if format == 'vtt':
-        write_vtt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    elif format == 'srt':
-        write_srt(segments, file=segmentStream, maxLineWidth=maxLineWidth)
-    else:
-        raise Exception("Unknown format " + format)
-
-    segmentStream.seek(0)
-    return segmentStream.read()
-
-
-def split_video_audio(uploaded_file):
-    with open(f"{save_dir}/input.mp4", "wb") as f:
-            f.write(uploaded_file.read())
-    audio = ffmpeg.input(f"{save_dir}/input.mp4")
-    audio = ffmpeg.output(audio, f"{save_dir}/output.wav", acodec="pcm_s16le", ac=1, ar="16k")
-    ffmpeg.run(audio, overwrite_output=True)
+def save_video(uploaded_file, work):
+    # The burn-in copies the audio track straight from this file, so no separate audio extraction is needed.
+    video = work / f"input{pathlib.Path(uploaded_file.name).suffix.lower()}"
+    digest = spool_upload(uploaded_file, video)
+    return video, digest
+
+
+def burn_subtitles(job, uploaded_video, transcript_file, ext, mode, cues):
+    job.update(0.05, "Saving the video...")
+    transcript_path = job.dir / f"uploaded_transcript.{ext}"
+    with stage(job, "upload", bytes=uploaded_video.size + transcript_file.size):
+        spool_upload(transcript_file, transcript_path)
+        video, digest = save_video(uploaded_video, job.dir)
+    job.update(0.2, "Generating Subtitled Video")
+    if mode != "burn":
+        subtitled = generate_subtitled_video(video, transcript_path, job.dir / "video_sub.mp4", mode, job)
+        return {"video": str(video), "subtitled": str(subtitled), "subtitles": str(transcript_path) if mode == "soft" else None,
+                "summary": None}
+    # Burning the same video again only re-encodes the parts whose subtitles were edited.
+    subtitled, summary = reburn(video, digest, cues, job.dir, job)
+    return {"video": str(video), "subtitled": str(subtitled), "subtitles": None, "summary": summary}
+
+
+def check_transcript(transcript_file):
+    """
+    Parse and validate the uploaded transcript before anything is encoded.
+    Returns its CueIndex, or None after showing why it cannot be used.
+    """
+    errors = []
+    transcript_file.seek(0)
+    try:
+        index = CueIndex(iter_cues(codecs.iterdecode(transcript_file, "utf-8-sig"), errors))
+    except UnicodeDecodeError:
+        st.error("The transcript is not UTF-8 text.")
+        return None
+    problems, warnings = index.check()
+    errors += problems
+    if not len(index):
+        errors.append("No subtitles found in the transcript.")
+    if errors:
+        st.error("Please fix the transcript and upload it again:\n\n" + "\n".join(f"- {message}" for message in errors))
+        return None
+    if warnings:
+        st.warning("The subtitles will be shown in time order, overlapping ones stacked:\n\n"
+                   + "\n".join(f"- {message}" for message in warnings))
+    seconds = st.slider("Check the subtitles at (seconds)", 0.0, max(index.duration, 1.0), 0.0, step=0.5)
+    st.text("\n".join(cue["text"] for cue in index.at(seconds)) or "(no subtitle)")
+    return index
 
 
 def main():
@@ -78,71 +97,32 @@ def main():
     else:
         transcript_name = None
     if uploaded_video is not None and transcript_file is not None:
-        if transcript_name[-3:] == "vtt":
-            with open("uploaded_transcript.vtt", "wb") as f:
-                f.writelines(transcript_file)
-                f.close()
-            with open(os.path.join(os.getcwd(), "uploaded_transcript.vtt"), "rb") as f:
-                vtt_file = f.read()
-            if st.button("Generate Video with Subtitles"):
-                with st.spinner("Generating Subtitled Video"):
-                    split_video_audio(uploaded_video)
-                    video_file = ffmpeg.input(f"{save_dir}/input.mp4")
-                    audio_file = ffmpeg.input(f"{save_dir}/output.wav")
-                    ffmpeg.concat(video_file.filter("subtitles", "uploaded_transcript.vtt"), audio_file, v=1, a=1).output("video_sub.mp4").run(quiet=True, overwrite_output=True)
-                    video_with_subs = open("video_sub.mp4", "rb")
-                col3, col4 = st.columns(2)
-                with col3:
-                    st.video(uploaded_video)
-                with col4:
-                    st.video(video_with_subs)
-                zipObj = ZipFile("subtitled_video.zip", "w")
-                zipObj.write("video_sub.mp4")
-                zipObj.close()
-                ZipfileDotZip = "subtitled_video.zip"
-                with open(ZipfileDotZip, "rb") as f:
-                    datazip = f.read()
-                    b64 = base64.b64encode(datazip).decode()
-                    href = f"<a href=\"data:file/zip;base64,{b64}\" download='{ZipfileDotZip}'>\
-            Download Subtitled Video\
-        </a>"
-                st.markdown(href, unsafe_allow_html=True)
-
-        elif transcript_name[-3:] == "srt":
-            with open("uploaded_transcript.srt", "wb") as f:
-                f.writelines(transcript_file)
-                f.close()
-            with open(os.path.join(os.getcwd(), "uploaded_transcript.srt"), "rb") as f:
-                srt_file = f.read()
-            if st.button("Generate Video with Subtitles"):
-                with st.spinner("Generating Subtitled Video"):
-                    split_video_audio(uploaded_video)
-                    video_file = ffmpeg.input(f"{save_dir}/input.mp4")
-                    audio_file = ffmpeg.input(f"{save_dir}/output.wav")
-                    ffmpeg.concat(video_file.filter("subtitles",  "uploaded_transcript.srt"), audio_file, v=1, a=1).output("video_sub.mp4").run(quiet=True, overwrite_output=True)
-                    video_with_subs = open("video_sub.mp4", "rb")
-                col3, col4 = st.columns(2)
-                with col3:
-                    st.video(uploaded_video)
-                with col4:
-                    st.video(video_with_subs)
-                zipObj = ZipFile("subtitled_video.zip", "w")
-                zipObj.write("video_sub.mp4")
-                zipObj.close()
-                ZipfileDotZip = "subtitled_video.zip"
-                with open(ZipfileDotZip, "rb") as f:
-                    datazip = f.read()
-                    b64 = base64.b64encode(datazip).decode()
-                    href = f"<a href=\"data:file/zip;base64,{b64}\" download='{ZipfileDotZip}'>\
-            Download Subtitled Video\
-        </a>"
-                st.markdown(href, unsafe_allow_html=True)
-        else:
+        ext = transcript_name[-3:]
+        if ext not in ("vtt", "srt"):
             st.error("Please upload a .srt or .vtt file")
+        else:
+            # Malformed cues are caught here instead of failing the encode minutes later.
+            index = check_transcript(transcript_file)
+            if index is not None:
+                mode = SUBTITLE_MODES[st.radio("Subtitles", list(SUBTITLE_MODES), horizontal=True)]
+                if st.button("Generate Video with Subtitles"):
+                    st.session_state["transcript_job"] = queue.submit("transcript", burn_subtitles, uploaded_video, transcript_file, ext,
+                                                                      mode, index.cues)
     else:
         st.info("Please upload a video file and a transcript file")
 
+    job = job_status("transcript_job")
+    if job is not None:
+        result = job.result
+        col3, col4 = st.columns(2)
+        with col3:
+            st.video(video_source(result["video"]))
+        with col4:
+            st.video(video_source(result["subtitled"]), subtitles=result["subtitles"])
+            if result["summary"]:
+                st.caption(result["summary"])
+        zip_download("transcript_zip", job, [result["subtitled"]], "subtitled_video.zip", "Download Subtitled Video")
+
 
 if __name__ == "__main__":
     main()
-        
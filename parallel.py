@@ -0,0 +1,205 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+import whisper
+
+from backends import get_backend
+from media import SAMPLE_RATE
+from models import load_model, model_lock
+
+# Worker processes used for chunked CPU transcription. Each one holds its own copy of the model.
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+# Length of the audio windows handed to the workers, and how much neighbouring windows overlap.
+CHUNK_WINDOW_SECONDS = float(os.environ.get("CHUNK_WINDOW_SECONDS", "300"))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get("CHUNK_OVERLAP_SECONDS", "10"))
+# Worker pools kept alive between jobs, each holding its model loaded in every worker.
+# The least recently used idle pool is shut down when another model needs one.
+CHUNK_POOLS = int(os.environ.get("CHUNK_POOLS", "1"))
+# Idle pools are shut down after this many seconds, so their model copies do not outlive the jobs using them.
+CHUNK_POOL_IDLE_SECONDS = float(os.environ.get("CHUNK_POOL_IDLE_SECONDS", "300"))
+
+_worker_model = None
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _init_worker(size, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    # Workers only transcribe, the page already showed the model's timings.
+    _worker_model = load_model(size, device="cpu", benchmark=False)
+
+
+def _transcribe_window(offset, audio, options):
+    start = time.perf_counter()
+    result = _worker_model.transcribe(audio, **options)
+    return offset, result["segments"], time.perf_counter() - start
+
+
+class _Pool:
+    """A worker pool and the number of jobs currently submitting to it."""
+
+    def __init__(self, size: str, workers: int, threads: int):
+        # spawn keeps torch's thread pools and the app's threads out of the workers.
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(size, threads))
+        self.users = 0
+        self.idle_since = time.monotonic()
+        # Set once the pool left _pools; it is shut down when its last user is done.
+        self.retired = False
+
+
+def _retire(entry: _Pool):
+    # Called with _pools_lock held.
+    entry.retired = True
+    if entry.users == 0:
+        entry.executor.shutdown(wait=False)
+
+
+def _trim(limit: int):
+    # Called with _pools_lock held. The dict is ordered from least to most recently used.
+    for key in [key for key, entry in _pools.items() if entry.users == 0][:max(len(_pools) - limit, 0)]:
+        _retire(_pools.pop(key))
+
+
+def _shutdown_idle():
+    with _pools_lock:
+        now = time.monotonic()
+        for key, entry in list(_pools.items()):
+            if entry.users == 0 and now - entry.idle_since >= CHUNK_POOL_IDLE_SECONDS:
+                _retire(_pools.pop(key))
+
+
+@contextmanager
+def worker_pool(size: str, workers: int, threads: int):
+    """
+    The worker pool for `size`, started on first use and kept for the following
+    jobs. A pool is never shut down while a job is using it.
+    """
+    key = (size, workers, threads)
+    with _pools_lock:
+        entry = _pools.pop(key, None)
+        if entry is None:
+            _trim(max(CHUNK_POOLS, 1) - 1)
+            entry = _Pool(size, workers, threads)
+        # Reinserted last, so the dict stays ordered from least to most recently used.
+        _pools[key] = entry
+        entry.users += 1
+    try:
+        yield entry.executor
+    except BrokenProcessPool:
+        # A crashed worker breaks the whole pool; the next job starts a fresh one.
+        with _pools_lock:
+            if _pools.get(key) is entry:
+                del _pools[key]
+            entry.retired = True
+        raise
+    finally:
+        with _pools_lock:
+            entry.users -= 1
+            entry.idle_since = time.monotonic()
+            if entry.retired:
+                _retire(entry)
+            # Pools started while every other one was in use are shut down once they are idle again.
+            _trim(max(CHUNK_POOLS, 1))
+        timer = threading.Timer(CHUNK_POOL_IDLE_SECONDS, _shutdown_idle)
+        timer.daemon = True
+        timer.start()
+
+
+def split_windows(n_samples: int, window: float, overlap: float):
+    """Yield (offset_seconds, start_sample, end_sample) for overlapping windows covering the audio."""
+    step = int(window * SAMPLE_RATE)
+    extra = int(overlap * SAMPLE_RATE)
+    for start in range(0, n_samples, step):
+        yield start / SAMPLE_RATE, start, min(start + step + extra, n_samples)
+        if start + step + extra >= n_samples:
+            break
+
+
+def stitch_segments(windows, overlap: float) -> list:
+    """
+    Merge per-window segments into one continuous list. Each overlap is cut at
+    its midpoint: a segment belongs to the window that contains its centre there,
+    repeated lines on either side of the cut are dropped, and timestamps are made
+    monotonic so the result can go straight to write_srt/write_vtt.
+    """
+    windows = sorted(windows, key=lambda w: w[0])
+    stitched = []
+    for i, (offset, segments) in enumerate(windows):
+        lo = offset + overlap / 2 if i > 0 else -math.inf
+        hi = windows[i + 1][0] + overlap / 2 if i + 1 < len(windows) else math.inf
+        for segment in segments:
+            start, end = segment["start"] + offset, segment["end"] + offset
+            if not lo <= (start + end) / 2 < hi:
+                continue
+            if stitched:
+                previous = stitched[-1]
+                if segment["text"].strip() == previous["text"].strip() and start < previous["end"] + overlap:
+                    continue
+                start = max(start, previous["end"])
+            segment = {**segment, "id": len(stitched), "start": start, "end": max(end, start)}
+            if "words" in segment:
+                segment["words"] = [{**w, "start": w["start"] + offset, "end": w["end"] + offset} for w in segment["words"]]
+            stitched.append(segment)
+    return stitched
+
+
+class ParallelTranscriber:
+    """
+    Drop-in for `model.transcribe` that splits long audio into overlapping
+    windows and transcribes them in a pool of CPU worker processes.
+    """
+
+    def __init__(self, model, size: str, workers: int = CHUNK_WORKERS,
+                 window: float = CHUNK_WINDOW_SECONDS, overlap: float = CHUNK_OVERLAP_SECONDS):
+        self.model = model
+        self.size = size
+        self.workers = workers
+        self.window = window
+        self.overlap = overlap
+
+    def transcribe(self, audio, **options) -> dict:
+        if not isinstance(audio, np.ndarray):
+            audio = whisper.load_audio(str(audio))
+        windows = list(split_windows(len(audio), self.window, self.overlap))
+        if len(windows) < 2 or self.workers < 2:
+            start = time.perf_counter()
+            with model_lock(self.model):
+                results = self.model.transcribe(audio, **options)
+            elapsed = time.perf_counter() - start
+            results["timing"] = {"workers": 1, "windows": 1, "wall_seconds": elapsed, "worker_seconds": elapsed}
+            return results
+
+        options = {"fp16": False, **options}
+        if options.get("language") is None:
+            # Detect once so every window decodes in the same language. This runs the shared model in this process.
+            with model_lock(self.model):
+                options["language"] = get_backend().detect_language(self.model, audio)
+
+        workers = min(self.workers, len(windows))
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        start = time.perf_counter()
+        with worker_pool(self.size, workers, threads) as pool:
+            futures = [pool.submit(_transcribe_window, offset, audio[lo:hi], options) for offset, lo, hi in windows]
+            outputs = [future.result() for future in futures]
+        wall = time.perf_counter() - start
+
+        segments = stitch_segments([(offset, segments) for offset, segments, _ in outputs], self.overlap)
+        # Summed time of the windows on their workers. Each worker only has a share of the cores, so this is
+        # not what one process would take; the pipeline compares the wall time against measured single-process runs.
+        busy = sum(elapsed for _, _, elapsed in outputs)
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+            "language": options["language"],
+            "timing": {"workers": workers, "windows": len(windows), "wall_seconds": wall, "worker_seconds": busy},
+        }
@@ -0,0 +1,220 @@
+import os
+from zipfile import ZipFile
+
+from backends import get_backend
+from bilingual import BilingualTranscriber
+from features import feature_cache
+from media import SAMPLE_RATE, burn_in, decode_audio, download_video, mux_subtitles, parallel_burn_in, preview_burn_in
+from metrics import stage
+from models import get_model, model_lock
+from parallel import ParallelTranscriber
+from profiles import DEFAULT_OPTIONS, history_key, resolve_profile, rtf_history
+from streaming import StreamingTranscriber
+from transcript_cache import file_digest, transcribe_cached, transcribe_tasks_cached
+from utils import render_subtitles, write_vtt, write_srt
+
+BILINGUAL = "bilingual"
+TASKS = {"Transcribe": "transcribe", "Translate": "translate", "Transcribe and Translate": BILINGUAL}
+SUBTITLE_MODES = {"Subtitle track (fast, no re-encode)": "soft", "Burn into the video": "burn",
+                  "Burn in, split across cores": "parallel"}
+
+
+def load_audio(path, job=None, digest=None):
+    """
+    Decoded PCM of `path`, memory-mapped from the feature cache when the same
+    file was decoded before, and the file's SHA-256. Pass `digest` if it is
+    already known; either way transcribe() should be given it, so the PCM is
+    not hashed again and every caller shares the same cache entries.
+    """
+    with stage(job, "decode", bytes=os.path.getsize(path)) as record:
+        digest = digest or file_digest(path)
+        audio = feature_cache.pcm(digest)
+        if audio is None:
+            audio = feature_cache.put_pcm(digest, decode_audio(path))
+        # Lets whisper.transcribe() reuse the cached log-mel features of this audio.
+        feature_cache.register(audio, digest)
+        record["audio_seconds"] = len(audio) / SAMPLE_RATE
+    return audio, digest
+
+
+def ingest(link, work, job=None):
+    # Fetch the progressive stream once and decode the audio locally, so
+    # transcription and burn-in both work from the same downloaded file.
+    with stage(job, "download") as record:
+        video = download_video(link, work)
+        record["bytes"] = os.path.getsize(video)
+    audio, digest = load_audio(video, job)
+    return video, audio, digest
+
+
+def transcribe(loaded_model, size, audio, task, parallel=False, report=None, on_segment=None, sentences=True, job=None,
+               digest=None, decode_options=None, translation=None):
+    """
+    Transcribe `audio` and render it as (txt, vtt, srt, language). For the
+    bilingual task the English translation is rendered into the `translation`
+    dict as {"txt", "vtt", "srt"}.
+    """
+    if task not in TASKS:
+        raise ValueError("Task not supported")
+    decode_options = DEFAULT_OPTIONS if decode_options is None else decode_options
+    options = dict(task=TASKS[task], **decode_options)
+    # Other engines' results are cached apart from openai-whisper's.
+    backend = get_backend().name
+    cache_name = size if backend == "whisper" else f"{backend}/{size}"
+    bilingual = TASKS[task] == BILINGUAL
+    with stage(job, "transcribe", audio_seconds=len(audio) / SAMPLE_RATE) as record:
+        if bilingual:
+            results = _transcribe_bilingual(loaded_model, cache_name, audio, backend, on_segment, digest, decode_options)
+        elif parallel:
+            transcriber = ParallelTranscriber(loaded_model, size)
+            results = transcribe_cached(transcriber, cache_name, audio, variant=f"parallel-{transcriber.window:g}-{transcriber.overlap:g}",
+                                        digest=digest, **options)
+        elif on_segment is not None:
+            transcriber = StreamingTranscriber(loaded_model, on_segment)
+            with model_lock(loaded_model):
+                results = transcribe_cached(transcriber, cache_name, audio, variant=f"stream-{transcriber.window:g}", digest=digest, **options)
+        else:
+            with model_lock(loaded_model):
+                results = transcribe_cached(loaded_model, cache_name, audio, digest=digest, **options)
+    english = None
+    if bilingual:
+        english = results["translate"]
+        results = results["transcribe"]
+    elif not results.get("cached"):
+        # Feeds the runtime estimates of the auto profile.
+        rtf_history.record(history_key(size, decode_options, parallel), record["seconds"], record["audio_seconds"])
+    if report is not None and "timing" in results:
+        report.update(results["timing"])
+        rtf = rtf_history.get(history_key(size, decode_options, False))
+        if report["workers"] > 1 and rtf is not None:
+            # Against the measured speed of single-process runs of the same model and options.
+            report["speedup"] = rtf * len(audio) / SAMPLE_RATE / report["wall_seconds"]
+    with stage(job, "render") as record:
+        subs = render_subtitles(results["segments"], 80, sentences=sentences)
+        record["bytes"] = sum(len(text.encode("utf8")) for text in subs.values())
+        if english is not None and translation is not None:
+            translation.update(render_subtitles(english["segments"], 80, sentences=sentences))
+    lang = results["language"]
+    return subs["txt"], subs["vtt"], subs["srt"], lang
+
+
+def _transcribe_bilingual(loaded_model, cache_name, audio, backend, on_segment, digest, decode_options) -> dict:
+    if backend != "whisper":
+        # Shared encoder features need openai-whisper's decode(); other engines run both tasks in turn.
+        results = {task: transcribe_cached(loaded_model, cache_name, audio, digest=digest, task=task, **decode_options)
+                   for task in ("transcribe", "translate")}
+        return {**results, "language": results["transcribe"]["language"]}
+    with model_lock(loaded_model):
+        return transcribe_tasks_cached(BilingualTranscriber(loaded_model, on_segment), cache_name, audio,
+                                       ("transcribe", "translate"), variant=BILINGUAL, digest=digest, **decode_options)
+
+
+class LivePreview:
+    """
+    Segment callback that appends each new cue to partial.srt and partial.vtt in
+    the job directory and advances the job's progress between `start` and `end`.
+    """
+
+    def __init__(self, job, start=0.2, end=0.8):
+        self.job = job
+        self.start = start
+        self.end = end
+        self.count = 0
+        self.srt = open(job.dir / "partial.srt", "w", encoding="utf8")
+        self.vtt = open(job.dir / "partial.vtt", "w", encoding="utf8")
+        write_vtt([], self.vtt)
+
+    def __call__(self, segment, duration):
+        self.count += 1
+        write_srt([segment], self.srt, maxLineWidth=80, first_index=self.count)
+        write_vtt([segment], self.vtt, maxLineWidth=80, header=False)
+        self.srt.flush()
+        self.vtt.flush()
+        done = min(segment["end"] / duration, 1.0) if duration else 0.0
+        self.job.update(self.start + (self.end - self.start) * done, f"Transcribed {self.count} subtitles, {done:.0%} of the audio")
+
+    def close(self):
+        self.srt.close()
+        self.vtt.close()
+
+
+def write_transcripts(txt, vtt, srt, work, job=None, stem="transcript") -> dict:
+    files = {fmt: work / f"{stem}.{fmt}" for fmt in ("txt", "vtt", "srt")}
+    contents = {"txt": txt, "vtt": vtt, "srt": srt}
+    with stage(job, "write") as record:
+        for fmt, path in files.items():
+            with open(path, "w+", encoding='utf8') as f:
+                f.write(contents[fmt])
+        record["bytes"] = sum(os.path.getsize(path) for path in files.values())
+    return files
+
+
+def subtitle_tracks(files: dict, translation: dict):
+    """Subtitles for st.video: the transcript, plus the English translation as a second track if there is one."""
+    if not translation:
+        return str(files["vtt"])
+    return {"Original": str(files["vtt"]), "English": str(translation["vtt"])}
+
+
+def transcription_job(job, audio, digest, size, task, parallel, decode, deadline, int8, live, sentences=True, media="video") -> dict:
+    """
+    The part the transcription pages' jobs share: pick the model for the decode
+    profile, transcribe `audio`, with live subtitles if `live`, and write the
+    transcripts to the job directory. Returns the job result, holding the
+    paths of the transcript and of its English translation, if any.
+    """
+    with stage(job, "load_model"):
+        size, options, summary = resolve_profile(decode, size, len(audio) / SAMPLE_RATE, deadline, int8, parallel)
+        loaded_model = get_model(size)
+    job.update(0.2, {"Transcribe": f"Transcribing the {media}...", "Translate": "Translating to English..."}
+               .get(task, f"Transcribing and translating the {media}..."))
+    timing = {}
+    translation = {}
+    preview = LivePreview(job) if live else None
+    try:
+        text, vtt, srt, lang = transcribe(loaded_model, size, audio, task, parallel, timing, on_segment=preview, sentences=sentences,
+                                          job=job, digest=digest, decode_options=options, translation=translation)
+    finally:
+        if preview is not None:
+            preview.close()
+    files = write_transcripts(text, vtt, srt, job.dir, job)
+    english = write_transcripts(translation["txt"], translation["vtt"], translation["srt"], job.dir, job, stem="translation") \
+        if translation else {}
+    return {"language": lang, "timing": timing, "profile": summary, "translation": {fmt: str(path) for fmt, path in english.items()},
+            **{fmt: str(path) for fmt, path in files.items()}}
+
+
+def generate_subtitled_video(video, transcript, output, mode="burn", job=None):
+    with stage(job, "mux" if mode == "soft" else "burn_in") as record:
+        if mode == "soft":
+            output = mux_subtitles(video, transcript, output)
+        elif mode == "parallel":
+            output = parallel_burn_in(video, transcript, output)
+        else:
+            output = burn_in(video, transcript, output)
+        record["bytes"] = os.path.getsize(output)
+    return output
+
+
+def render_preview(video, transcript, output, job=None):
+    """Low-resolution excerpt with the subtitles burned in, shown while the full-quality render waits for a request."""
+    with stage(job, "preview") as record:
+        output = preview_burn_in(video, transcript, output)
+        record["bytes"] = os.path.getsize(output)
+    return output
+
+
+def render_full(job, video, transcript, mode):
+    """Job rendering the full-quality subtitled video of an earlier job that only made a preview."""
+    job.update(0.05, "Rendering the full-quality video...")
+    subtitled = generate_subtitled_video(video, transcript, job.dir / "final.mp4", mode, job)
+    return {"subtitled": str(subtitled)}
+
+
+def zip_files(zip_path, files, job=None):
+    with stage(job, "zip") as record:
+        with ZipFile(zip_path, "w") as zipObj:
+            for path in files:
+                zipObj.write(path, path.name)
+        record["bytes"] = os.path.getsize(zip_path)
+    return zip_path
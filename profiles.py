@@ -0,0 +1,107 @@
+import json
+import os
+import pathlib
+import threading
+
+from backends import get_backend
+from models import DEVICE, model_name
+
+# Named speed/accuracy trade-offs: a model size and the decode options passed to transcribe().
+# "balanced" keeps the options the app has always used, so its cached transcripts stay valid.
+PROFILES = {
+    "fast": {"size": "base", "options": {"best_of": 1, "temperature": 0.0, "condition_on_previous_text": False}},
+    "balanced": {"size": "small", "options": {"best_of": 5}},
+    "accurate": {"size": "medium", "options": {"best_of": 5, "beam_size": 5}},
+}
+# From the fastest to the most accurate.
+PROFILE_ORDER = ["fast", "balanced", "accurate"]
+CUSTOM = "custom"
+AUTO = "auto"
+PROFILE_CHOICES = [CUSTOM, *PROFILE_ORDER, AUTO]
+PROFILE_HELP = ("Fast: base model, greedy decoding. Balanced: small model, best of 5 samples. "
+                "Accurate: medium model, beam search. Auto: the most accurate profile expected to finish in time, "
+                "estimated from the media duration and the speed of past jobs. Custom: pick the model yourself.")
+DEFAULT_OPTIONS = PROFILES["balanced"]["options"]
+
+# Real-time factors (transcription seconds per audio second) assumed before any job has been
+# measured. The measured values replace them as jobs finish.
+PRIOR_RTF = {"fast": 0.15, "balanced": 0.6, "accurate": 2.5}
+GPU_SPEEDUP = 10
+
+RTF_HISTORY_FILE = pathlib.Path(os.environ.get("RTF_HISTORY_FILE", pathlib.Path(__file__).parent.absolute() / "cache" / "rtf.json"))
+# Weight of the newest measurement in the running average.
+RTF_SMOOTHING = 0.3
+
+
+def history_key(size: str, options: dict, parallel: bool) -> str:
+    return json.dumps({"backend": get_backend().name, "device": DEVICE, "model": size, "options": options,
+                       "parallel": parallel}, sort_keys=True)
+
+
+class RTFHistory:
+    """Running average of measured real-time factors per model and decode options, kept on disk across restarts."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf8") as f:
+                self._rtf = json.load(f)
+        except (OSError, ValueError):
+            self._rtf = {}
+
+    def get(self, key: str):
+        with self._lock:
+            return self._rtf.get(key)
+
+    def record(self, key: str, seconds: float, audio_seconds: float):
+        if audio_seconds <= 0:
+            return
+        rtf = seconds / audio_seconds
+        with self._lock:
+            previous = self._rtf.get(key)
+            self._rtf[key] = rtf if previous is None else (1 - RTF_SMOOTHING) * previous + RTF_SMOOTHING * rtf
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(self._rtf, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+rtf_history = RTFHistory(RTF_HISTORY_FILE)
+
+
+def estimate_seconds(profile: str, duration: float, int8: bool = False, parallel: bool = False) -> float:
+    settings = PROFILES[profile]
+    rtf = rtf_history.get(history_key(model_name(settings["size"], int8), settings["options"], parallel))
+    if rtf is None:
+        rtf = PRIOR_RTF[profile] / (GPU_SPEEDUP if DEVICE == "cuda" else 1)
+    return rtf * duration
+
+
+def choose_profile(duration: float, deadline: float, int8: bool = False, parallel: bool = False):
+    """
+    Most accurate profile expected to transcribe `duration` seconds of audio
+    within `deadline` seconds, or the fastest one if none fits.
+    Returns (profile, estimated seconds).
+    """
+    estimates = {name: estimate_seconds(name, duration, int8, parallel) for name in PROFILE_ORDER}
+    fitting = [name for name in PROFILE_ORDER if estimates[name] <= deadline]
+    profile = fitting[-1] if fitting else PROFILE_ORDER[0]
+    return profile, estimates[profile]
+
+
+def resolve_profile(profile: str, size: str, duration: float, deadline: float = None, int8: bool = False,
+                    parallel: bool = False):
+    """
+    Turn the profile picked in the UI into (model name, decode options, description).
+    `size` is the model chosen for the custom profile; auto needs the media duration and a deadline.
+    """
+    if profile == CUSTOM:
+        return size, DEFAULT_OPTIONS, f"Custom profile with the {size} model."
+    if profile == AUTO:
+        profile, estimate = choose_profile(duration, deadline, int8, parallel)
+        size = model_name(PROFILES[profile]["size"], int8)
+        return size, PROFILES[profile]["options"], f"Auto picked the {profile} profile ({size}, estimated {estimate / 60:.1f} min)."
+    size = model_name(PROFILES[profile]["size"], int8)
+    return size, PROFILES[profile]["options"], f"{profile.capitalize()} profile with the {size} model."
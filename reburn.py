@@ -0,0 +1,141 @@
+import json
+import os
+import pathlib
+import shutil
+from bisect import bisect_right
+from collections import Counter
+
+from disk_cache import LRUDirectory, tmp_path
+from media import (BURN_ENCODER, BURN_KEYFRAME_SECONDS, burn_in, burn_range, keyframes, output_container, splice,
+                   split_video, write_cues)
+from metrics import stage
+from utils import shift_cues
+
+REBURN_CACHE_DIR = pathlib.Path(os.environ.get("REBURN_CACHE_DIR", pathlib.Path(__file__).parent.absolute() / "cache" / "burns"))
+# Total size of the kept burned videos, in megabytes, before the least recently used are removed.
+REBURN_CACHE_MB = int(os.environ.get("REBURN_CACHE_MB", "2048"))
+# Past this share of the video changing, splicing saves too little over burning everything again.
+REBURN_MAX_FRACTION = 0.5
+
+
+def cue_key(cue: dict):
+    return round(cue["start"] * 1000), round(cue["end"] * 1000), cue["text"].strip()
+
+
+def changed_ranges(old: list, new: list, bounds: list, duration: float) -> list:
+    """
+    Keyframe-aligned (start, end) ranges of the video that show a cue present
+    in only one of `old` and `new`. `bounds` are the keyframe times of the
+    video burned with `old`.
+    """
+    old_keys, new_keys = Counter(map(cue_key, old)), Counter(map(cue_key, new))
+    changed = sorted((old_keys - new_keys) + (new_keys - old_keys))
+    ranges = []
+    for start_ms, end_ms, _ in changed:
+        if start_ms / 1000 >= duration:
+            continue
+        first = bisect_right(bounds, start_ms / 1000) - 1
+        last = bisect_right(bounds, end_ms / 1000)
+        start = bounds[first] if first >= 0 else 0.0
+        end = bounds[last] if last < len(bounds) else duration
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+class BurnCache(LRUDirectory):
+    """
+    The last burned output of each source video and the cues it was burned
+    with, so the next burn of that video can reuse everything that did not
+    change. Each source video's directory is one entry.
+    """
+
+    def _dir(self, digest: str) -> pathlib.Path:
+        return self.root / digest[:2] / digest
+
+    def get(self, digest: str):
+        """Return (video path, cues) of the previous burn of this video with the current encoder settings, or None."""
+        path = self._dir(digest)
+        try:
+            with open(path / "cues.json", encoding="utf8") as f:
+                entry = json.load(f)
+            video = path / entry["video"]
+            if entry["settings"] != _settings() or not video.exists():
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        self.touch(path)
+        return video, entry["cues"]
+
+    def put(self, digest: str, video, cues: list):
+        video = pathlib.Path(video)
+        path = self._dir(digest)
+        tmp = tmp_path(path)
+        tmp.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(video, tmp / video.name)
+        except OSError:
+            shutil.copyfile(video, tmp / video.name)
+        with open(tmp / "cues.json", "w", encoding="utf8") as f:
+            json.dump({"settings": _settings(), "video": video.name, "cues": cues}, f)
+        self.commit(tmp, path)
+
+
+def _settings() -> dict:
+    return {**BURN_ENCODER, "keyframe_seconds": BURN_KEYFRAME_SECONDS}
+
+
+burn_cache = BurnCache(REBURN_CACHE_DIR, REBURN_CACHE_MB * 2**20)
+
+
+def reburn(video, digest: str, cues: list, work, job=None):
+    """
+    Burn `cues` into `video`, whose contents hash to `digest`. When this video
+    was burned before, only the keyframe intervals around cues that changed
+    since are encoded again; the rest is stream-copied from the previous
+    output. Returns (output path, description of the work done).
+    """
+    work = pathlib.Path(work)
+    output = output_container(video, work / "video_sub.mp4")
+    previous = burn_cache.get(digest)
+    with stage(job, "burn_in") as record:
+        summary = None
+        if previous is not None and previous[0].suffix == output.suffix:
+            bounds, duration = keyframes(previous[0])
+            ranges = changed_ranges(previous[1], cues, bounds, duration)
+            if sum(end - start for start, end in ranges) <= REBURN_MAX_FRACTION * duration:
+                summary = _splice(video, previous[0], cues, ranges, duration, work, output)
+        if summary is None:
+            burn_in(video, write_cues(cues, work / "subtitles.srt"), output)
+            summary = "Burned the subtitles into the whole video."
+        record["bytes"] = os.path.getsize(output)
+    burn_cache.put(digest, output, cues)
+    return output, summary
+
+
+def _splice(video, previous, cues, ranges, duration, work, output):
+    # Returns None if the previous output could not be cut at the expected keyframes.
+    if not ranges:
+        shutil.copyfile(previous, output)
+        return "The subtitles did not change, reused the previous video."
+    parts_dir = work / "parts"
+    parts_dir.mkdir(exist_ok=True)
+    cuts = sorted({t for span in ranges for t in span if 0 < t < duration})
+    split_video(previous, cuts, parts_dir / "part%04d.ts")
+    edges = [0.0, *cuts, duration]
+    if not all((parts_dir / f"part{i:04d}.ts").exists() for i in range(len(edges) - 1)):
+        return None
+    parts = []
+    for i, (start, end) in enumerate(zip(edges, edges[1:])):
+        path = parts_dir / f"part{i:04d}.ts"
+        if any(first <= start and end <= last for first, last in ranges):
+            shown = shift_cues(cues, start, end)
+            # A range whose only change is a removed cue may have nothing left to draw.
+            subtitles = write_cues(shown, parts_dir / f"part{i:04d}.srt") if shown else None
+            burn_range(video, subtitles, path, start, end if end < duration else None)
+        parts.append((path, end - start))
+    splice(parts, video, output)
+    changed = sum(end - start for start, end in ranges)
+    return f"Re-encoded {changed:.1f}s of {duration:.1f}s around the changed subtitles and copied the rest."
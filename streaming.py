@@ -0,0 +1,73 @@
+import os
+
+from whisper.audio import HOP_LENGTH
+
+from media import SAMPLE_RATE
+
+# Audio decoded per model.transcribe call while streaming. Shorter windows show
+# the first subtitles sooner, longer ones give the model more context.
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", "90"))
+# Characters of already transcribed text passed as prompt to the next window.
+PROMPT_CHARS = 200
+
+
+class SegmentStream:
+    """
+    Iterate over the segments of `audio` as they are decoded. The audio is
+    transcribed window by window; the last segment of a window may be cut off
+    by the window boundary, so it is dropped and the next window starts where
+    the last complete segment ended. Timestamps are relative to the whole audio.
+    `language` is known after the first window.
+    """
+
+    def __init__(self, model, audio, window: float = STREAM_WINDOW_SECONDS, **options):
+        self.model = model
+        self.audio = audio
+        self.window = window
+        self.options = options
+        self.language = options.get("language")
+        self.duration = len(audio) / SAMPLE_RATE
+
+    def __iter__(self):
+        options = dict(self.options)
+        window = int(self.window * SAMPLE_RATE)
+        offset = 0
+        index = 0
+        while offset < len(self.audio):
+            chunk = self.audio[offset:offset + window]
+            result = self.model.transcribe(chunk, **options)
+            if self.language is None:
+                self.language = result["language"]
+            options["language"] = self.language
+
+            segments = result["segments"]
+            last = offset + window >= len(self.audio)
+            if not last and len(segments) > 1:
+                segments = segments[:-1]
+            advance = int(segments[-1]["end"] * SAMPLE_RATE) if segments and not last else len(chunk)
+            # Windows start on mel frame boundaries, so their features can be cut from the cached spectrogram.
+            advance -= advance % HOP_LENGTH
+            seconds = offset / SAMPLE_RATE
+            for segment in segments:
+                yield {**segment, "id": index, "start": segment["start"] + seconds, "end": segment["end"] + seconds}
+                index += 1
+            if segments:
+                options["initial_prompt"] = "".join(s["text"] for s in segments)[-PROMPT_CHARS:]
+            offset += advance if advance > 0 else len(chunk)
+
+
+class StreamingTranscriber:
+    """Drop-in for `model.transcribe` that calls `on_segment(segment, duration)` for every segment as it is decoded."""
+
+    def __init__(self, model, on_segment, window: float = STREAM_WINDOW_SECONDS):
+        self.model = model
+        self.on_segment = on_segment
+        self.window = window
+
+    def transcribe(self, audio, **options) -> dict:
+        stream = SegmentStream(self.model, audio, self.window, **options)
+        segments = []
+        for segment in stream:
+            segments.append(segment)
+            self.on_segment(segment, stream.duration)
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": stream.language}
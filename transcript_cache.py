@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from disk_cache import LRUDirectory, tmp_path
+
+CACHE_DIR = pathlib.Path(os.environ.get("TRANSCRIPT_CACHE_DIR", pathlib.Path(__file__).parent.absolute() / "cache" / "transcripts"))
+# Total size of the cached results, in megabytes, before the oldest entries are removed.
+CACHE_MB = int(os.environ.get("TRANSCRIPT_CACHE_MB", "512"))
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def audio_digest(audio) -> str:
+    # Decoded PCM is hashed directly; a path is hashed by its file contents.
+    if isinstance(audio, np.ndarray):
+        return hashlib.sha256(memoryview(np.ascontiguousarray(audio))).hexdigest()
+    return file_digest(audio)
+
+
+def cache_key(audio_digest: str, model_size: str, options: dict) -> str:
+    payload = json.dumps({"audio": audio_digest, "model": model_size, "options": options}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache(LRUDirectory):
+    """
+    On-disk store of transcription results addressed by the decoded audio and
+    the decode settings, so a resubmitted file or link skips inference even
+    after a restart.
+    """
+
+    ENTRIES = "*/*.json"
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf8") as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(path)
+        return results
+
+    def put(self, key: str, results: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"text": results["text"], "segments": results["segments"], "language": results["language"]}
+        tmp = tmp_path(path)
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        self.commit(tmp, path)
+
+
+transcript_cache = TranscriptCache(CACHE_DIR, CACHE_MB * 2**20)
+
+
+def transcribe_cached(model, model_size: str, audio, variant: str = None, digest: str = None, **options) -> dict:
+    # `audio` is either decoded 16 kHz PCM or a path to an audio file.
+    # `variant` separates results of alternative transcription paths that use the same model and options.
+    # `digest` is a hash of the source file computed earlier, e.g. while spooling an upload; it saves hashing the PCM.
+    digest = f"file:{digest}" if digest is not None else audio_digest(audio)
+    key = cache_key(digest, model_size if variant is None else f"{model_size}/{variant}", options)
+    results = transcript_cache.get(key)
+    if results is not None:
+        results["cached"] = True
+        return results
+    results = model.transcribe(audio if isinstance(audio, np.ndarray) else str(audio), **options)
+    transcript_cache.put(key, results)
+    return results
+
+
+def transcribe_tasks_cached(transcriber, model_size: str, audio, tasks, variant: str = None, digest: str = None, **options) -> dict:
+    """
+    transcribe_cached() for a transcriber whose results hold one transcript per task,
+    e.g. BilingualTranscriber. Each transcript is cached under the key a single-task
+    run with the same variant would use, so either half can be reused later.
+    """
+    digest = f"file:{digest}" if digest is not None else audio_digest(audio)
+    name = model_size if variant is None else f"{model_size}/{variant}"
+    keys = {task: cache_key(digest, name, {**options, "task": task}) for task in tasks}
+    cached = {task: transcript_cache.get(key) for task, key in keys.items()}
+    if all(result is not None for result in cached.values()):
+        return {**cached, "language": cached[tasks[0]]["language"], "cached": True}
+    results = transcriber.transcribe(audio if isinstance(audio, np.ndarray) else str(audio), **options)
+    for task, key in keys.items():
+        transcript_cache.put(key, results[task])
+    return results
@@ -0,0 +1,228 @@
+import os
+import pathlib
+import time
+from html import escape
+
+import streamlit as st
+
+from backends import INT8_SUFFIX
+from jobs import FAILED, queue
+from models import DEVICE, INT8_DEFAULT, get_model, model_name, model_profile, registry
+from media import PREVIEW_HEIGHT, PREVIEW_SECONDS
+from pipeline import render_full, zip_files
+from profiles import AUTO, CUSTOM, PROFILE_CHOICES, PROFILE_HELP, PROFILES
+from streaming import STREAM_WINDOW_SECONDS
+from workspace import publish
+
+POLL_SECONDS = 1.0
+PREVIEW_BYTES = 8192
+
+
+def partial_transcript(job):
+    """Live preview of the subtitles written so far by a running job's LivePreview."""
+    path = job.dir / "partial.srt"
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    # Only the most recent cues are shown, the download has everything so far.
+    st.text_area("Subtitles so far", data[-PREVIEW_BYTES:].decode("utf8", errors="ignore"), height=250, disabled=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download partial transcript (.srt)", data=data, file_name="partial_transcript.srt")
+    with col2:
+        with open(job.dir / "partial.vtt", "rb") as f:
+            st.download_button("Download partial transcript (.vtt)", data=f.read(), file_name="partial_transcript.vtt")
+
+
+def download_link(path, file_name: str, label: str):
+    """
+    Link to a file served from disk. Files too large for the static server
+    fall back to a download button, which is only built when asked for.
+    """
+    url = publish(path, file_name)
+    if url is None:
+        # st.download_button holds the whole file in memory, so it is read on the one run after the
+        # request instead of on every rerun of the page.
+        if st.button(f"Prepare {label}", key=f"prepare_{path}"):
+            with open(path, "rb") as f:
+                st.download_button(label, data=f, file_name=file_name, key=f"download_{path}")
+        return
+    st.markdown(f'<a href="{url}" download="{escape(file_name)}">{escape(label)}</a>', unsafe_allow_html=True)
+
+
+def video_source(path) -> str:
+    """
+    What to give st.video for a video on disk: its absolute static URL, which the
+    browser fetches directly, or the path if the file is too large to publish.
+    A path is read into memory and hashed by Streamlit on every rerun.
+    """
+    url = publish(path, pathlib.Path(path).name)
+    # st.video only passes through absolute URLs, so the page's own origin is put in front of the static path.
+    origin = st.context.headers.get("Origin")
+    if url is None or origin is None:
+        return str(path)
+    base = st.get_option("server.baseUrlPath").strip("/")
+    return "/".join(part for part in (origin.rstrip("/"), base, url) if part)
+
+
+def zip_download(key: str, job, files, zip_name: str, label: str):
+    """
+    Offer `files` as one ZIP archive. The archive is only written to the job
+    directory once the user asks for it, and is then linked like any other file.
+    """
+    if st.session_state.get(key) != job.id:
+        if not st.button(f"Prepare {zip_name}", key=f"{key}_button"):
+            return
+        st.session_state[key] = job.id
+    archive = job.dir / zip_name
+    if not archive.exists():
+        with st.spinner("Preparing the download..."):
+            tmp = zip_files(job.dir / f"{zip_name}.tmp", [pathlib.Path(path) for path in files])
+            os.replace(tmp, archive)
+    download_link(archive, zip_name, label)
+
+
+def full_render(key: str, job, file_name: str):
+    """
+    For a job that burned in only a preview: describe the preview, offer to
+    queue the full-quality render, and link the result once it is done.
+    """
+    result = job.result
+    if not result.get("preview"):
+        return
+    length = f"the first {PREVIEW_SECONDS / 60:g} minutes" if PREVIEW_SECONDS else "the whole video"
+    st.caption(f"The subtitled video above is a {PREVIEW_HEIGHT}p preview of {length}.")
+    # A new transcription job starts over with its own preview.
+    if st.session_state.get(f"{key}_source") != job.id:
+        st.session_state.pop(key, None)
+        st.session_state[f"{key}_source"] = job.id
+    if key not in st.session_state:
+        if st.button("Render full-quality video", key=f"{key}_button"):
+            st.session_state[key] = queue.submit("render", render_full, result["video"], result["srt"], result["mode"])
+            st.rerun()
+        return
+    render = job_status(key)
+    if render is not None:
+        subtitled = render.result["subtitled"]
+        download_link(subtitled, f"{file_name}{pathlib.Path(subtitled).suffix}", "Download Full-Quality Video")
+
+
+def live_preview_control() -> bool:
+    """Checkbox opting a transcription into live subtitles, which costs decoding speed."""
+    return st.checkbox("Show subtitles while transcribing", value=False,
+        help=f"Decodes the audio in {STREAM_WINDOW_SECONDS:g} second windows so the subtitles appear as they are "
+            "transcribed. Each window boundary is decoded twice, so this is slower than a plain transcription.")
+
+
+def parallel_caption(timing: dict):
+    """Describe a transcription split across worker processes."""
+    if timing.get("workers", 1) < 2:
+        return
+    busy = timing["worker_seconds"] / (timing["wall_seconds"] * timing["workers"]) if timing["wall_seconds"] else 0.0
+    caption = (f"Transcribed {timing['windows']} windows on {timing['workers']} workers in {timing['wall_seconds']:.0f}s, "
+               f"workers busy {busy:.0%} of the time")
+    if "speedup" in timing:
+        caption += f", {timing['speedup']:.1f}x faster than single-process runs of this model."
+    else:
+        caption += ". The speedup is shown once this model has also run without splitting."
+    st.caption(caption)
+
+
+def quantization_caption(profile: dict):
+    """Compare a quantized model's footprint and encoder speed with the fp32 model it was built from."""
+    if "fp32_mb" not in profile:
+        return
+    caption = (f"Int8 model: {profile['mb']:,.0f} MB instead of {profile['fp32_mb']:,.0f} MB in fp32 "
+               f"({profile['mb'] / profile['fp32_mb']:.0%})")
+    # Timings are only measured when the model is first quantized from the page, not by the parallel workers.
+    if "int8_encoder_seconds" in profile:
+        caption += (f", one encoder pass takes {profile['int8_encoder_seconds']:.2f}s "
+                    f"instead of {profile['fp32_encoder_seconds']:.2f}s "
+                    f"({profile['fp32_encoder_seconds'] / profile['int8_encoder_seconds']:.1f}x faster)")
+    st.caption(caption + ".")
+
+
+def model_summary(size: str):
+    """Load the selected model ahead of the job and describe it, with the state of the model cache."""
+    loaded_model = get_model(size)
+    profile = model_profile(size)
+    st.write(f"Model is {'multilingual' if loaded_model.is_multilingual else 'English-only'}"
+        + (f" and has {profile['parameters']:,} parameters." if "parameters" in profile else "."))
+    quantization_caption(profile)
+    stats = registry.stats()
+    device = "cpu" if size.endswith(INT8_SUFFIX) else DEVICE
+    load_seconds = stats["load_seconds"].get(f"{size}@{device}")
+    loaded = f"{size} loaded in {load_seconds:.1f}s. " if load_seconds is not None else ""
+    st.caption(f"{loaded}Model cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['resident_mb']:,.0f}/{stats['budget_mb']:,.0f} MB resident ({', '.join(stats['resident'])})")
+
+
+def decode_controls(sizes=None, index=1, custom_size=None):
+    """
+    Decode profile, model size and quantization widgets of the transcription pages.
+    The custom profile offers `sizes`, or uses `custom_size` without showing the model.
+    Returns (profile, model name, deadline in seconds, int8); the model name is
+    None for the auto profile, which picks it once the media duration is known.
+    """
+    profile = st.selectbox("Decode profile", PROFILE_CHOICES, format_func=str.capitalize, help=PROFILE_HELP)
+    size = deadline = None
+    if profile == CUSTOM:
+        size = custom_size or st.selectbox("Select Model Size (The larger the model, the more accurate the transcription will be, but it will take longer)", sizes, index=index)
+    elif profile == AUTO:
+        deadline = 60 * st.number_input("Finish the transcription within (minutes)", min_value=1, value=10)
+    int8 = st.checkbox("Int8 quantized model", value=INT8_DEFAULT and DEVICE == "cpu", disabled=DEVICE != "cpu",
+        help="Quantizes the model's linear layers to 8-bit integers. Uses a fraction of the memory and runs faster on CPU, "
+            "at a small cost in accuracy.")
+    if profile != AUTO:
+        size = model_name(size if profile == CUSTOM else PROFILES[profile]["size"], int8)
+        if sizes is not None:
+            model_summary(size)
+    return profile, size, deadline, int8
+
+
+def stage_breakdown(job):
+    """Table of the time, bytes and audio seconds spent in each stage of a finished job."""
+    if not job.stages:
+        return
+    total = sum(record["seconds"] for record in job.stages)
+    with st.expander(f"Timing breakdown ({total:.1f}s)"):
+        st.dataframe([{
+            "Stage": record["stage"],
+            "Seconds": round(record["seconds"], 2),
+            "Share": f"{record['seconds'] / total:.0%}" if total else "",
+            "MB": round(record["bytes"] / 2**20, 2) if "bytes" in record else None,
+            "Audio seconds": round(record["audio_seconds"], 1) if "audio_seconds" in record else None,
+        } for record in job.stages], hide_index=True, use_container_width=True)
+
+
+def job_status(key: str, preview=None):
+    """
+    Render the state of the job whose id is stored in st.session_state[key].
+    Returns the job once it has finished, otherwise None. While the job is
+    queued or running `preview(job)` is rendered, if given, and the script
+    sleeps and reruns itself to poll again.
+    """
+    job_id = st.session_state.get(key)
+    if job_id is None:
+        return None
+    job = queue.get(job_id)
+    if job is None:
+        del st.session_state[key]
+        st.warning("The results of this job have expired. Please run it again.")
+        return None
+    if job.status == FAILED:
+        st.error(f"The job failed: {job.error}")
+        stage_breakdown(job)
+        return None
+    if job.active:
+        st.progress(job.progress, text=job.message)
+        stats = queue.stats()
+        st.caption(f"{stats['running']} running and {stats['queued']} queued jobs on {stats['workers']} workers. "
+            "You can keep using the page, the job continues in the background.")
+        if preview is not None:
+            preview(job)
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+    stage_breakdown(job)
+    return job
@@ -1,7 +1,10 @@
+import re
 import textwrap
 import zlib
 from typing import Iterator, TextIO
 
+import numpy as np
+
 
 def exact_div(x, y):
     assert x % y == 0
@@ -45,25 +48,281 @@ def format_timestamp(seconds: float, always_include_hours: bool = False, fractio
     return f"{hours_marker}{minutes:02d}:{seconds:02d}{fractionalSeperator}{milliseconds:03d}"
 
 
-def write_txt(transcript: Iterator[dict], file: TextIO):
-    for segment in transcript:
-        print(segment['text'].strip(), file=file, flush=True)
+class SegmentTable:
+    """
+    Column-oriented transcript: start/end times as integer millisecond arrays
+    plus the cue texts. Built once per transcript so every output format can be
+    rendered from it with vectorized timestamp formatting.
+    """
+
+    def __init__(self, start_ms, end_ms, texts):
+        self.start_ms = np.asarray(start_ms, dtype=np.int64)
+        self.end_ms = np.asarray(end_ms, dtype=np.int64)
+        self.texts = list(texts)
+
+    @classmethod
+    def from_segments(cls, segments):
+        if isinstance(segments, SegmentTable):
+            return segments
+        segments = list(segments)
+        start = np.fromiter((segment['start'] for segment in segments), dtype=np.float64, count=len(segments))
+        end = np.fromiter((segment['end'] for segment in segments), dtype=np.float64, count=len(segments))
+        return cls(np.round(start * 1000.0), np.round(end * 1000.0), [segment['text'] for segment in segments])
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def format_timestamps(milliseconds, always_include_hours: bool = False, fractionalSeperator: str = '.') -> list:
+    """Vectorized format_timestamp() over an array of integer milliseconds."""
+    milliseconds = np.asarray(milliseconds, dtype=np.int64)
+    assert (milliseconds >= 0).all(), "non-negative timestamp expected"
+    hours, rest = np.divmod(milliseconds, 3_600_000)
+    minutes, rest = np.divmod(rest, 60_000)
+    seconds, rest = np.divmod(rest, 1_000)
+    if len(hours) and hours.max() > 99:
+        return [format_timestamp(ms / 1000.0, always_include_hours, fractionalSeperator) for ms in milliseconds.tolist()]
+
+    # Write the digits of every timestamp into a fixed-width "HH:MM:SS.mmm" byte buffer at once.
+    digits = np.stack([hours // 10, hours % 10, minutes // 10, minutes % 10, seconds // 10, seconds % 10,
+                       rest // 100, rest // 10 % 10, rest % 10], axis=1).astype(np.uint8) + ord('0')
+    buffer = np.full((len(milliseconds), 12), ord(':'), dtype=np.uint8)
+    buffer[:, [0, 1, 3, 4, 6, 7, 9, 10, 11]] = digits
+    buffer[:, 8] = ord(fractionalSeperator)
+    stamps = buffer.view('S12').ravel().astype('U12').tolist()
+    if always_include_hours:
+        return stamps
+    return [stamp if hour else stamp[3:] for stamp, hour in zip(stamps, hours.tolist())]
+
+
+VTT_HEADER = "WEBVTT\n\n"
+SENTENCE_END = re.compile("([!?.])")
+# The characters textwrap treats as whitespace.
+WRAP_WHITESPACE = "\t\n\x0b\x0c\r "
+CUE_TIMING = re.compile(r"^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})")
+
 
+def parse_timestamp(stamp: str) -> float:
+    """Seconds of an SRT ("00:01:02,500") or WebVTT ("01:02.500") timestamp."""
+    seconds = 0.0
+    for part in stamp.replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
 
-def write_vtt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
-    print("WEBVTT\n", file=file)
-    for segment in transcript:
-        text = processText(segment['text'], maxLineWidth).replace('-->', '->')
 
-        print(
-            f"{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n"
-            f"{text}\n",
-            file=file,
-            flush=True,
-        )
+def iter_cues(lines, errors: list = None) -> Iterator[dict]:
+    """
+    Parse SRT or WebVTT cues one at a time from an iterable of lines, such as
+    an open file, without reading the whole document. Yields {"start", "end",
+    "text", "line"} in file order, "line" being the line number of the timing.
+    Cue numbers and identifiers, cue settings, notes and style blocks are
+    dropped. Malformed cues are skipped and, if `errors` is given, reported
+    in it.
+    """
+    block, first = [], 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if number == 1:
+            line = line.lstrip('\ufeff')
+        if line.strip():
+            if not block:
+                first = number
+            block.append(line)
+            continue
+        if block:
+            cue = _parse_cue(block, first, errors)
+            if cue is not None:
+                yield cue
+            block = []
+    if block:
+        cue = _parse_cue(block, first, errors)
+        if cue is not None:
+            yield cue
+
+
+def _parse_cue(block: list, first: int, errors):
+    for i, line in enumerate(block[:2]):
+        if '-->' not in line:
+            continue
+        match = CUE_TIMING.match(line)
+        if match is None:
+            if errors is not None:
+                errors.append(f"line {first + i}: malformed timing {line.strip()!r}")
+            return None
+        return {"start": parse_timestamp(match[1]), "end": parse_timestamp(match[2]),
+                "text": '\n'.join(block[i + 1:]), "line": first + i}
+    # SRT cues start with their number; one without a timing line is broken rather than a VTT note or header.
+    if block[0].strip().isdigit() and errors is not None:
+        errors.append(f"line {first}: cue {block[0].strip()} has no timing line")
+    return None
 
 
-def write_srt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
+def shift_cues(cues, offset: float, end: float = None) -> list:
+    """
+    Cues shown between `offset` and `end` (or the end of the video), timed
+    relative to `offset`, for rendering onto a clip that starts there. Cues
+    already showing at `offset` start at zero.
+    """
+    return [dict(cue, start=max(cue["start"] - offset, 0.0), end=cue["end"] - offset)
+            for cue in cues if cue["end"] > offset and (end is None or cue["start"] < end)]
+
+
+class CueIndex(SegmentTable):
+    """
+    Cues sorted by start time, with a segment tree holding the latest end
+    time under each node, so the cues showing at any time are found in
+    O(log n) per cue found, however long the other cues last. Passes to the
+    subtitle writers like any transcript.
+    """
+
+    # Problems reported by check() per kind before the rest are only counted.
+    MAX_REPORTED = 10
+
+    def __init__(self, cues):
+        cues = list(cues)
+        order = sorted(range(len(cues)), key=lambda i: (cues[i]["start"], cues[i]["end"]))
+        self.cues = [cues[i] for i in order]
+        table = SegmentTable.from_segments(self.cues)
+        super().__init__(table.start_ms, table.end_ms, table.texts)
+        # Position of each sorted cue in the file.
+        self.order = np.asarray(order, dtype=np.int64)
+        self.max_end_ms = np.maximum.accumulate(self.end_ms) if len(cues) else self.end_ms
+        # Implicit binary tree: leaves are the end times in start order from index `leaves`, and every
+        # inner node holds the maximum of its two children.
+        self.leaves = 1 << max(len(cues) - 1, 0).bit_length()
+        self.tree = np.full(2 * self.leaves, np.iinfo(np.int64).min, dtype=np.int64)
+        self.tree[self.leaves:self.leaves + len(cues)] = self.end_ms
+        level = self.leaves
+        while level > 1:
+            self.tree[level // 2:level] = np.maximum(self.tree[level:2 * level:2], self.tree[level + 1:2 * level:2])
+            level //= 2
+
+    @property
+    def duration(self) -> float:
+        return float(self.max_end_ms[-1]) / 1000 if len(self) else 0.0
+
+    def at(self, seconds: float) -> list:
+        """
+        Cues showing at `seconds`, in start order: among the cues starting by
+        then, the ones ending after it. Subtrees ending earlier are skipped.
+        """
+        t = round(seconds * 1000)
+        started = int(np.searchsorted(self.start_ms, t, side='right'))
+        found = []
+        # (node, first leaf under it); the right child is pushed first so leaves come out in order.
+        stack = [(1, 0)] if started else []
+        tree = self.tree
+        while stack:
+            node, first = stack.pop()
+            if first >= started or tree[node] <= t:
+                continue
+            if node >= self.leaves:
+                found.append(self.cues[first])
+                continue
+            # Leaves under each child of `node`.
+            half = self.leaves >> node.bit_length()
+            stack.append((2 * node + 1, first + half))
+            stack.append((2 * node, first))
+        return found
+
+    def check(self):
+        """
+        Validate the cues without decoding any video. Returns (errors,
+        warnings): cues that end before they start are errors; zero-length
+        cues, which Whisper emits, cues out of order in the file and
+        overlapping cues are warnings.
+        """
+        errors, warnings = [], []
+        self._report(errors, np.flatnonzero(self.end_ms < self.start_ms), "ends before it starts")
+        self._report(warnings, np.flatnonzero(self.end_ms == self.start_ms), "has no duration and is never shown")
+        # Sorting by start time moved a cue if it starts before the one preceding it in the file.
+        file_order = np.empty_like(self.order)
+        file_order[self.order] = np.arange(len(self.order))
+        starts = self.start_ms[file_order]
+        unordered = file_order[np.flatnonzero(starts[1:] < starts[:-1]) + 1]
+        self._report(warnings, unordered, "starts before the previous cue in the file")
+        overlapping = np.flatnonzero(self.start_ms[1:] < self.max_end_ms[:-1]) + 1
+        self._report(warnings, overlapping, "overlaps an earlier cue")
+        return errors, warnings
+
+    def _report(self, messages: list, indices, problem: str):
+        for i in indices[:self.MAX_REPORTED].tolist():
+            cue = self.cues[i]
+            where = f"line {cue['line']}" if "line" in cue else f"cue {self.order[i] + 1}"
+            messages.append(f"{where}: {format_timestamp(cue['start'])} --> {format_timestamp(max(cue['end'], 0))} {problem}")
+        if len(indices) > self.MAX_REPORTED:
+            messages.append(f"{len(indices) - self.MAX_REPORTED} more cues {problem}")
+
+
+def render_subtitles(transcript, maxLineWidth=None, formats=("txt", "vtt", "srt"), sentences=False, first_index=1) -> dict:
+    """
+    Render a transcript to every requested format in a single pass over its cues.
+    With `sentences` the TXT output has one paragraph per sentence (split on !, ? and .)
+    instead of the raw text.
+    """
+    table = SegmentTable.from_segments(transcript)
+    chunks = {fmt: [] for fmt in formats}
+    if "srt" in chunks:
+        srt_start = format_timestamps(table.start_ms, True, ',')
+        srt_end = format_timestamps(table.end_ms, True, ',')
+    if "vtt" in chunks:
+        vtt_start = format_timestamps(table.start_ms)
+        vtt_end = format_timestamps(table.end_ms)
+        chunks["vtt"].append(VTT_HEADER)
+    sentence = []
+
+    for i, text in enumerate(table.texts):
+        stripped = text.strip()
+        if "srt" in chunks or "vtt" in chunks:
+            wrapped = processText(stripped, maxLineWidth)
+            cue = wrapped.replace('-->', '->')
+        if "srt" in chunks:
+            chunks["srt"].append(f"{i + first_index}\n{srt_start[i]} --> {srt_end[i]}\n{cue}\n\n")
+        if "vtt" in chunks:
+            # VTT keeps the cue's leading whitespace like it always has.
+            if text != stripped:
+                cue = indentWrapped(text, stripped, wrapped, maxLineWidth).replace('-->', '->')
+            chunks["vtt"].append(f"{vtt_start[i]} --> {vtt_end[i]}\n{cue}\n\n")
+        if "txt" in chunks:
+            if not sentences:
+                chunks["txt"].append(text)
+                continue
+            # Sentences may span cues, so the unfinished one is carried over; text after the last
+            # punctuation mark is dropped, matching the previous re.split based implementation.
+            parts = SENTENCE_END.split(text)
+            sentence.append(parts[0])
+            for mark, rest in zip(parts[1::2], parts[2::2]):
+                sentence.append(mark)
+                chunks["txt"].append("".join(sentence))
+                sentence = [rest]
+
+    separator = "\n\n" if sentences else ""
+    return {fmt: (separator if fmt == "txt" else "").join(parts) for fmt, parts in chunks.items()}
+
+
+def write_subtitles(transcript, files: dict, maxLineWidth=None, sentences=False):
+    """Render once and write each format to its file, e.g. files={"srt": srt_file, "vtt": vtt_file}."""
+    rendered = render_subtitles(transcript, maxLineWidth, formats=tuple(files), sentences=sentences)
+    for fmt, file in files.items():
+        file.write(rendered[fmt])
+
+
+def getSubs(segments: Iterator[dict], format: str, maxLineWidth: int) -> str:
+    if format not in ('vtt', 'srt'):
+        raise Exception("Unknown format " + format)
+    return render_subtitles(segments, maxLineWidth, formats=(format,))[format]
+
+
+def write_txt(transcript: Iterator[dict], file: TextIO):
+    file.write("".join(f"{text.strip()}\n" for text in SegmentTable.from_segments(transcript).texts))
+
+
+def write_vtt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None, header=True):
+    vtt = render_subtitles(transcript, maxLineWidth, formats=("vtt",))["vtt"]
+    file.write(vtt if header else vtt[len(VTT_HEADER):])
+
+
+def write_srt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None, first_index=1):
     """
     Write a transcript to a file in SRT format.
     Example usage:
@@ -75,18 +334,23 @@ def write_srt(transcript: Iterator[dict], file: TextIO, maxLineWidth=None):
         with open(Path(output_dir) / (audio_basename + ".srt"), "w", encoding="utf-8") as srt:
             write_srt(result["segments"], file=srt)
     """
-    for i, segment in enumerate(transcript, start=1):
-        text = processText(segment['text'].strip(), maxLineWidth).replace('-->', '->')
-
-        # write srt lines
-        print(
-            f"{i}\n"
-            f"{format_timestamp(segment['start'], always_include_hours=True, fractionalSeperator=',')} --> "
-            f"{format_timestamp(segment['end'], always_include_hours=True, fractionalSeperator=',')}\n"
-            f"{text}\n",
-            file=file,
-            flush=True,
-        )
+    file.write(render_subtitles(transcript, maxLineWidth, formats=("srt",), first_index=first_index)["srt"])
+
+def indentWrapped(text: str, stripped: str, wrapped: str, maxLineWidth=None):
+    """
+    processText(text) for a cue whose stripped text is already wrapped as
+    `wrapped`. While the leading whitespace still fits on the first line the
+    lines are the same, so the text is only wrapped again when it does not.
+    """
+    if maxLineWidth is None or maxLineWidth < 0:
+        return text
+    lead = text[:len(text) - len(text.lstrip(WRAP_WHITESPACE))]
+    # textwrap turns whitespace into spaces, expanding tabs to the next stop, which the indent would move.
+    indent = len(lead.expandtabs(4))
+    if not stripped or '\t' in stripped or text.strip(WRAP_WHITESPACE) != stripped or indent + len(wrapped.split('\n', 1)[0]) > maxLineWidth:
+        return processText(text, maxLineWidth)
+    return ' ' * indent + wrapped
+
 
 def processText(text: str, maxLineWidth=None):
     if (maxLineWidth is None or maxLineWidth < 0):
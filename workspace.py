@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pathlib
+import secrets
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+JOBS_DIR = pathlib.Path(os.environ.get("JOBS_DIR", pathlib.Path(__file__).parent.absolute() / "jobs"))
+# Job directories older than this are removed even if their owner never cleaned up.
+JOB_TTL_HOURS = float(os.environ.get("JOB_TTL_HOURS", "6"))
+
+# Uploads are copied to the job directory in pieces of this size.
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+# Downloads are linked into Streamlit's static folder (server.enableStaticServing),
+# which streams them from disk instead of holding them in the session.
+STATIC_DIR = pathlib.Path(__file__).parent.absolute() / "static"
+DOWNLOADS_DIR = STATIC_DIR / "downloads"
+# Streamlit refuses to serve static files larger than this.
+MAX_STATIC_BYTES = 200 * 2**20
+
+_published = {}
+
+
+def cleanup_expired(max_age_hours: float = JOB_TTL_HOURS):
+    cutoff = time.time() - max_age_hours * 3600
+    for root in (JOBS_DIR, DOWNLOADS_DIR):
+        if not root.exists():
+            continue
+        for path in root.iterdir():
+            try:
+                if path.is_dir() and path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def new_job_dir(prefix: str = "job") -> pathlib.Path:
+    """Create a private scratch directory for one job, so concurrent sessions never share file names."""
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    cleanup_expired()
+    return pathlib.Path(tempfile.mkdtemp(prefix=f"{prefix}_", dir=JOBS_DIR))
+
+
+def spool_upload(uploaded_file, path) -> str:
+    """
+    Copy an uploaded file to `path` chunk by chunk and return the SHA-256 of
+    its contents, so memory use stays flat whatever the size of the upload.
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: uploaded_file.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def remove_job_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def job_dir(prefix: str = "job"):
+    path = new_job_dir(prefix)
+    try:
+        yield path
+    finally:
+        remove_job_dir(path)
+
+
+def publish(path, file_name: str):
+    """
+    Expose `path` under an unguessable static URL and return that URL, or None
+    if the file is too large for Streamlit's static server. The file is hard
+    linked when possible, so publishing costs no copy.
+    """
+    path = pathlib.Path(path)
+    file_name = pathlib.Path(file_name).name
+    stat = path.stat()
+    if stat.st_size > MAX_STATIC_BYTES:
+        return None
+    key = (str(path), stat.st_mtime_ns, file_name)
+    if key in _published and (DOWNLOADS_DIR / _published[key]).exists():
+        return f"app/static/downloads/{quote(_published[key])}"
+    token = secrets.token_urlsafe(16)
+    target = DOWNLOADS_DIR / token / file_name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    _published[key] = f"{token}/{file_name}"
+    return f"app/static/downloads/{quote(_published[key])}"